@@ -4,46 +4,591 @@ Handles real NFC operations on Android devices
 """
 
 import json
-from typing import Optional, Any
+import time
+import zlib
+import queue
+import hashlib
+import threading
+from typing import Callable, Optional, Any
 from kivy.utils import platform
 
+import payload
+import tracing
+
 if platform == 'android':
-    from jnius import autoclass
-    
-    NfcAdapter = autoclass('android.nfc.NfcAdapter')
+    from jnius import autoclass, cast, JavaException
+    from android.runnable import run_on_ui_thread
+else:
+    # Mock for testing
+    def run_on_ui_thread(func):
+        return func
+
+MIME_TYPE = 'application/org.nfc.passwordmanager'
+
+# Классы Android API: загрузка через jnius медленная,
+# поэтому они загружаются при инициализации NFC, а не при импорте
+NfcAdapter = None
+Intent = None
+PendingIntent = None
+Ndef = None
+MifareUltralight = None
+NdefMessage = None
+NdefRecord = None
+Settings = None
+String = None
+Toast = None
+
+
+def load_android_classes():
+    global NfcAdapter, Intent, PendingIntent, Ndef, MifareUltralight
+    global NdefMessage, NdefRecord, Settings, String, Toast
+    if NfcAdapter is not None:
+        return
     Intent = autoclass('android.content.Intent')
+    PendingIntent = autoclass('android.app.PendingIntent')
     Ndef = autoclass('android.nfc.tech.Ndef')
+    MifareUltralight = autoclass('android.nfc.tech.MifareUltralight')
     NdefMessage = autoclass('android.nfc.NdefMessage')
     NdefRecord = autoclass('android.nfc.NdefRecord')
+    Settings = autoclass('android.provider.Settings')
     String = autoclass('java.lang.String')
     Toast = autoclass('android.widget.Toast')
-    
-    MIME_TYPE = 'application/org.nfc.passwordmanager'
-else:
-    # Mock for testing
-    NfcAdapter = None
-    MIME_TYPE = 'application/org.nfc.passwordmanager'
+    NfcAdapter = autoclass('android.nfc.NfcAdapter')
+
+
+# Очередь операций с метками и время ожидания операций (сек)
+NFC_QUEUE_SIZE = 8
+NFC_READ_TIMEOUT = 3.0
+NFC_WRITE_TIMEOUT = 5.0
+# Повторные Intent той же метки в этом окне (сек) - одно касание;
+# то же содержимое метки в этом окне не обрабатывается повторно
+NFC_TAP_WINDOW = 1.5
+NFC_DUPLICATE_WINDOW = 10.0
+
+# Память NTAG: страницы по 4 байта, команда READ возвращает 4 страницы,
+# пользовательская память (NDEF) начинается со страницы 4
+PAGE_SIZE = 4
+READ_PAGES = 4
+USER_PAGE_START = 4
+
+
+class TagLostError(IOError):
+    """Метка убрана во время операции"""
+
+
+class PageWriter:
+    """NDEF поверх постраничного доступа к метке
+
+    read_block(page) - 16 байт начиная со страницы page (команда READ),
+    write_page(page, data) - запись 4 байт (команда WRITE). Страницы
+    считаются от начала пользовательской памяти.
+    """
+
+    def __init__(self, read_block: Callable[[int], bytes],
+                 write_page: Callable[[int, bytes], Any], capacity: int):
+        self.read_block = read_block
+        self.write_page = write_page
+        self.capacity = capacity
+        # Итог последней записи
+        self.pages_written = 0
+        self.pages_skipped = 0
+
+    def read_memory(self, page: int, count: int) -> bytes:
+        """Чтение count страниц командами READ"""
+        out = bytearray()
+        end = min(page + count, self.capacity // PAGE_SIZE)
+        while page < end:
+            block = self.read_block(page)
+            chunk = min(READ_PAGES, end - page)
+            out += block[:chunk * PAGE_SIZE]
+            page += chunk
+        return bytes(out)
+
+    def read_ndef(self) -> Optional[bytes]:
+        """Данные MIME записи: заголовок TLV, затем остаток сообщения"""
+        head = self.read_memory(0, READ_PAGES)
+        if not head or head[0] != 0x03:
+            return None
+        if head[1] == 0xFF:
+            size = 4 + int.from_bytes(head[2:4], 'big')
+        else:
+            size = 2 + head[1]
+        pages = -(-size // PAGE_SIZE)
+        memory = head + self.read_memory(READ_PAGES, pages - READ_PAGES)
+        return payload.decode_ndef(memory)
+
+    def write_ndef(self, data: bytes) -> bool:
+        """Запись только изменившихся страниц с проверкой чтением
+
+        Страница 0 (длина TLV) пишется последней. Прерванная запись
+        может смешать старые и новые страницы - такие данные не пройдут
+        проверку AES-GCM при чтении.
+        """
+        message = payload.encode_ndef(data)
+        if len(message) > self.capacity:
+            print(f"Данные не помещаются на метку ({self.capacity} байт)")
+            return False
+
+        pages = -(-len(message) // PAGE_SIZE)
+        message = message.ljust(pages * PAGE_SIZE, b'\0')
+        current = self.read_memory(0, pages)
+        changed = [page for page in range(pages)
+                   if current[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+                   != message[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]]
+        if changed and changed[0] == 0:
+            changed.append(changed.pop(0))
+
+        for page in changed:
+            self.write_page(page, message[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+        self.pages_written = len(changed)
+        self.pages_skipped = pages - len(changed)
+
+        # Проверка: контрольная сумма считанных обратно страниц
+        if not changed:
+            return True
+        written = self.read_memory(0, pages)
+        if zlib.crc32(written) != zlib.crc32(message):
+            print("Проверка записи не пройдена: данные на метке отличаются")
+            return False
+        return True
+
+
+class AndroidTagBackend:
+    """Операции с NDEF меткой через Android API"""
+
+    @staticmethod
+    def tag_from_intent(intent):
+        action = intent.getAction()
+        if action not in (NfcAdapter.ACTION_NDEF_DISCOVERED,
+                          NfcAdapter.ACTION_TECH_DISCOVERED,
+                          NfcAdapter.ACTION_TAG_DISCOVERED):
+            return None
+        tag = intent.getParcelableExtra(NfcAdapter.EXTRA_TAG)
+        # jnius возвращает Parcelable - без приведения нет getId()
+        return cast('android.nfc.Tag', tag) if tag is not None else None
+
+    @staticmethod
+    def uid(tag) -> bytes:
+        return bytes(b & 0xFF for b in tag.getId())
+
+    @staticmethod
+    def connect(tag):
+        ndef = Ndef.get(tag)
+        if ndef is None:
+            raise IOError("Метка не поддерживает NDEF")
+        try:
+            ndef.connect()
+        except JavaException as e:
+            raise TagLostError(str(e))
+        return ndef
+
+    @staticmethod
+    def read(tag) -> Optional[bytes]:
+        ndef = AndroidTagBackend.connect(tag)
+        try:
+            message = ndef.getNdefMessage()
+            if message is None:
+                return None
+            for record in message.getRecords():
+                mime = bytes(b & 0xFF for b in record.getType()).decode('ascii', errors='replace')
+                if mime == MIME_TYPE:
+                    return bytes(b & 0xFF for b in record.getPayload())
+            return None
+        except JavaException as e:
+            if 'TagLost' in str(e):
+                raise TagLostError(str(e))
+            raise IOError(str(e))
+        finally:
+            AndroidTagBackend.close(ndef)
+
+    @staticmethod
+    def write(tag, data: bytes) -> bool:
+        """Запись постранично через MifareUltralight (NTAG), иначе через Ndef"""
+        ultralight = MifareUltralight.get(tag)
+        if ultralight is not None:
+            try:
+                ultralight.connect()
+                writer = AndroidTagBackend.page_writer(ultralight)
+                if writer is not None:
+                    return writer.write_ndef(data)
+            except JavaException as e:
+                if 'TagLost' in str(e):
+                    raise TagLostError(str(e))
+                raise IOError(str(e))
+            finally:
+                AndroidTagBackend.close(ultralight)
+        return AndroidTagBackend.write_ndef(tag, data)
+
+    @staticmethod
+    def page_writer(ultralight) -> Optional[PageWriter]:
+        """PageWriter для размеченной под NDEF метки NTAG"""
+        def read_block(page):
+            return bytes(b & 0xFF for b in ultralight.readPages(USER_PAGE_START + page))
+
+        def write_page(page, data):
+            ultralight.writePage(USER_PAGE_START + page, data)
+
+        # Capability container (страница 3): размер области данных / 8
+        cc = bytes(b & 0xFF for b in ultralight.readPages(3))
+        if cc[0] != 0xE1 or not cc[2]:
+            return None
+        return PageWriter(read_block, write_page, cc[2] * 8)
+
+    @staticmethod
+    def write_ndef(tag, data: bytes) -> bool:
+        record = NdefRecord.createMime(MIME_TYPE, data)
+        message = NdefMessage([record])
+        ndef = AndroidTagBackend.connect(tag)
+        try:
+            if not ndef.isWritable():
+                print("Метка защищена от записи")
+                return False
+            if message.getByteArrayLength() > ndef.getMaxSize():
+                print(f"Данные не помещаются на метку ({ndef.getMaxSize()} байт)")
+                return False
+            ndef.writeNdefMessage(message)
+            return True
+        except JavaException as e:
+            if 'TagLost' in str(e):
+                raise TagLostError(str(e))
+            raise IOError(str(e))
+        finally:
+            AndroidTagBackend.close(ndef)
+
+    @staticmethod
+    def abort(tag):
+        # close() из другого потока прерывает заблокированную операцию
+        ndef = Ndef.get(tag)
+        if ndef is not None:
+            AndroidTagBackend.close(ndef)
+
+    @staticmethod
+    def close(ndef):
+        try:
+            ndef.close()
+        except JavaException:
+            pass
+
+
+class NFCJob:
+    """Операция с меткой в очереди NFCWorker"""
+
+    def __init__(self, tag, uid: bytes, operation, args, callback, timeout: float):
+        self.tag = tag
+        self.uid = uid
+        self.operation = operation
+        self.args = args
+        self.callback = callback
+        self.timeout = timeout
+        self.timer = None
+        self.done = False
+        self.cancelled = False
+
+
+class NFCWorker:
+    """Поток операций с метками
+
+    Операции выполняются по очереди вне потока интерфейса, результат
+    callback(result, error) передается через schedule (Clock.schedule_once).
+    error - None, 'timeout', 'tag_lost', 'cancelled', 'busy' или 'error'.
+    """
+
+    def __init__(self, schedule=None, on_timeout=None, maxsize: int = NFC_QUEUE_SIZE):
+        self.schedule = schedule
+        # Прерывание зависшей операции: on_timeout(job)
+        self.on_timeout = on_timeout
+        self.jobs = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, job: NFCJob) -> NFCJob:
+        """Постановка операции в очередь"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='nfc-io', daemon=True)
+            self.thread.start()
+
+        job.timer = threading.Timer(job.timeout, self.expire, (job,))
+        job.timer.daemon = True
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.finish(job, None, 'busy')
+            return job
+        job.timer.start()
+        return job
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if job.done or job.cancelled:
+                continue
+
+            result, error = None, None
+            try:
+                with tracing.span(f'nfc.{job.operation.__name__}', 'nfc', uid=job.uid.hex()):
+                    result = job.operation(*job.args)
+            except TagLostError as e:
+                print(f"Метка потеряна: {e}")
+                error = 'tag_lost'
+                self.cancel(job.uid)
+            except Exception as e:
+                print(f"Ошибка операции с меткой: {e}")
+                error = 'error'
+            self.finish(job, result, error)
+
+    def finish(self, job: NFCJob, result, error: Optional[str]):
+        """Завершение операции; повторные завершения игнорируются"""
+        with self.lock:
+            if job.done:
+                return
+            job.done = True
+        if job.timer is not None:
+            job.timer.cancel()
+        self.deliver(job.callback, result, error)
+
+    def deliver(self, callback, result, error):
+        if self.schedule:
+            self.schedule(lambda dt: callback(result, error))
+        else:
+            callback(result, error)
+
+    def expire(self, job: NFCJob):
+        """Время операции истекло"""
+        if job.done:
+            return
+        job.cancelled = True
+        self.finish(job, None, 'timeout')
+        if self.on_timeout:
+            self.on_timeout(job)
+
+    def cancel(self, uid: Optional[bytes] = None):
+        """Отмена операций с меткой uid (или всех) в очереди"""
+        with self.jobs.mutex:
+            pending = list(self.jobs.queue)
+        for job in pending:
+            if job is not None and (uid is None or job.uid == uid):
+                job.cancelled = True
+                self.finish(job, None, 'cancelled')
+
+    def stop(self):
+        self.cancel()
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread = None
+
+
+class TapDebouncer:
+    """Подавление повторных касаний метки
+
+    Intent метки с тем же UID, пришедший в пределах window после
+    предыдущего, считается частью того же касания (окно скользящее,
+    поэтому серия Intent сливается в одно). То же содержимое той же
+    метки в пределах content_window повторно не обрабатывается.
+    """
+
+    def __init__(self, window: float = NFC_TAP_WINDOW,
+                 content_window: float = NFC_DUPLICATE_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.content_window = content_window
+        self.clock = clock
+        # UID -> время последнего Intent
+        self.last_tap = {}
+        # UID -> (хэш содержимого, время чтения)
+        self.last_content = {}
+        self.stats = {
+            'intents': 0,
+            'suppressed_taps': 0,
+            'reads': 0,
+            'suppressed_reads': 0,
+        }
+
+    def accept_tap(self, uid: bytes) -> bool:
+        """Обрабатывать ли Intent метки uid"""
+        now = self.clock()
+        self.stats['intents'] += 1
+        last = self.last_tap.get(uid)
+        self.last_tap[uid] = now
+        self.prune(now)
+        if last is not None and now - last < self.window:
+            self.stats['suppressed_taps'] += 1
+            return False
+        return True
+
+    def accept_content(self, uid: bytes, data: bytes) -> bool:
+        """Обрабатывать ли считанные с метки данные"""
+        now = self.clock()
+        self.stats['reads'] += 1
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        last = self.last_content.get(uid)
+        self.last_content[uid] = (digest, now)
+        if last is not None and last[0] == digest and now - last[1] < self.content_window:
+            self.stats['suppressed_reads'] += 1
+            return False
+        return True
+
+    def forget(self, uid: bytes):
+        """Операция с меткой не удалась - следующее касание обрабатывается"""
+        self.last_tap.pop(uid, None)
+        self.last_content.pop(uid, None)
+
+    def prune(self, now: float):
+        if len(self.last_tap) + len(self.last_content) < 64:
+            return
+        self.last_tap = {uid: seen for uid, seen in self.last_tap.items()
+                         if now - seen < self.window}
+        self.last_content = {uid: item for uid, item in self.last_content.items()
+                             if now - item[1] < self.content_window}
+
 
 class AndroidNFCManager:
-    def __init__(self):
+    def __init__(self, backend=None, schedule=None):
         self.nfc_adapter = None
-        if platform == 'android':
-            self.initialize_nfc()
-    
+        self.activity = None
+        self.backend = backend
+        # Адаптер NFC инициализируется после запуска (initialize_nfc)
+        # или при первом обращении к нему
+        self.initialized = False
+        self.init_lock = threading.Lock()
+
+        if schedule is None:
+            from kivy.clock import Clock
+            schedule = Clock.schedule_once
+        self.worker = NFCWorker(schedule=schedule, on_timeout=self.abort_job)
+        self.debouncer = TapDebouncer()
+
     def initialize_nfc(self):
+        """Загрузка классов Android и получение адаптера NFC (один раз)"""
         if platform != 'android':
             return False
-        try:
-            PythonActivity = autoclass('org.kivy.android.PythonActivity')
-            self.activity = PythonActivity.mActivity
-            self.nfc_adapter = NfcAdapter.getDefaultAdapter(self.activity)
-            return self.nfc_adapter is not None
-        except:
-            return False
-    
+        with self.init_lock:
+            if self.initialized:
+                return self.nfc_adapter is not None
+            self.initialized = True
+            try:
+                load_android_classes()
+                PythonActivity = autoclass('org.kivy.android.PythonActivity')
+                self.activity = PythonActivity.mActivity
+                self.nfc_adapter = NfcAdapter.getDefaultAdapter(self.activity)
+                self.backend = self.backend or AndroidTagBackend()
+                return self.nfc_adapter is not None
+            except:
+                return False
+
     def is_nfc_available(self):
+        self.initialize_nfc()
         if platform != 'android' or not self.nfc_adapter:
             return False
         return self.nfc_adapter.isEnabled()
 
+    def enable_foreground_dispatch(self):
+        self.initialize_nfc()
+        if platform != 'android' or not self.nfc_adapter:
+            return False
+        self.set_foreground_dispatch(True)
+        return True
+
+    def disable_foreground_dispatch(self):
+        if platform != 'android' or not self.nfc_adapter:
+            return
+        self.set_foreground_dispatch(False)
+        self.worker.cancel()
+
+    @run_on_ui_thread
+    def set_foreground_dispatch(self, enabled):
+        try:
+            if not enabled:
+                self.nfc_adapter.disableForegroundDispatch(self.activity)
+                return
+            intent = Intent(self.activity, self.activity.getClass())
+            intent.addFlags(Intent.FLAG_ACTIVITY_SINGLE_TOP)
+            # FLAG_MUTABLE обязателен с Android 12, на старых версиях его нет
+            flags = getattr(PendingIntent, 'FLAG_MUTABLE', 0)
+            pending = PendingIntent.getActivity(self.activity, 0, intent, flags)
+            self.nfc_adapter.enableForegroundDispatch(self.activity, pending, None, None)
+        except JavaException as e:
+            print(f"Ошибка foreground dispatch: {e}")
+
+    @run_on_ui_thread
+    def show_toast(self, message):
+        if platform != 'android':
+            print(f"Toast: {message}")
+            return
+        Toast.makeText(self.activity, cast('java.lang.CharSequence', String(message)),
+                       Toast.LENGTH_SHORT).show()
+
+    def open_nfc_settings(self):
+        if platform != 'android':
+            print("Открыть настройки NFC")
+            return
+        self.activity.startActivity(Intent(Settings.ACTION_NFC_SETTINGS))
+
+    def process_intent(self, intent):
+        """Метка из Intent или None (в том числе для повторного касания)"""
+        if self.backend is None or intent is None:
+            return None
+        tag = self.backend.tag_from_intent(intent)
+        if tag is not None and not self.debouncer.accept_tap(self.tag_uid(tag)):
+            return None
+        return tag
+
+    def tag_uid(self, tag) -> bytes:
+        return self.backend.uid(tag)
+
+    def read_from_tag(self, tag) -> Optional[bytes]:
+        """Синхронное чтение (вне потока интерфейса)"""
+        try:
+            return self.backend.read(tag)
+        except IOError as e:
+            print(f"Ошибка чтения метки: {e}")
+            return None
+
+    def write_to_tag(self, data: bytes, tag) -> bool:
+        """Синхронная запись (вне потока интерфейса)"""
+        try:
+            return self.backend.write(tag, data)
+        except IOError as e:
+            print(f"Ошибка записи метки: {e}")
+            return False
+
+    def read_from_tag_async(self, tag, callback, timeout: float = NFC_READ_TIMEOUT) -> NFCJob:
+        """Чтение в потоке NFC, callback(data, error) в главном потоке
+
+        Уже обработанное содержимое той же метки приходит с ошибкой
+        'duplicate' (данные передаются, решение принимает экран).
+        """
+        uid = self.tag_uid(tag)
+
+        def done(data, error):
+            if error:
+                self.debouncer.forget(uid)
+            elif data is not None and not self.debouncer.accept_content(uid, data):
+                error = 'duplicate'
+            callback(data, error)
+
+        job = NFCJob(tag, uid, self.backend.read, (tag,), done, timeout)
+        return self.worker.submit(job)
+
+    def write_to_tag_async(self, data: bytes, tag, callback,
+                           timeout: float = NFC_WRITE_TIMEOUT) -> NFCJob:
+        """Запись в потоке NFC, callback(success, error) в главном потоке"""
+        uid = self.tag_uid(tag)
+
+        def done(success, error):
+            if not success:
+                self.debouncer.forget(uid)
+            callback(success, error)
+
+        job = NFCJob(tag, uid, self.backend.write, (tag, data), done, timeout)
+        return self.worker.submit(job)
+
+    def cancel(self, tag=None):
+        """Отмена ожидающих операций с меткой (или всех)"""
+        self.worker.cancel(self.tag_uid(tag) if tag is not None else None)
+
+    def abort_job(self, job: NFCJob):
+        if hasattr(self.backend, 'abort'):
+            self.backend.abort(job.tag)
+
 nfc_manager = AndroidNFCManager()
@@ -0,0 +1,233 @@
+"""
+Vault CLI
+Пакетные операции с хранилищем без Kivy: импорт, экспорт,
+перешифрование данных меток и статистика
+
+    python cli.py stats
+    python cli.py export -o vault.jsonl
+    python cli.py import passwords.csv
+    python cli.py reencrypt -i tags.txt -o tags_new.txt
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import getpass
+import argparse
+import contextlib
+from typing import Dict, Iterator, Optional, TextIO
+
+import vault
+import payload
+import tracing
+from vault import PasswordManager, EncryptionManager
+from storage import username_key
+
+# Импортированные записи сбрасываются на диск пачками такого размера
+IMPORT_FLUSH_EVERY = 1000
+FIELDS = ('service', 'username', 'password')
+
+
+def open_manager(storage_mode: Optional[str] = None) -> PasswordManager:
+    """Хранилище в текущем каталоге, без поискового индекса"""
+    if storage_mode:
+        vault.STORAGE_MODE = storage_mode
+    return PasswordManager(index_search=False)
+
+
+def open_output(path: Optional[str], stdout: TextIO) -> TextIO:
+    if not path or path == '-':
+        return stdout
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def open_input(path: Optional[str]) -> TextIO:
+    if not path or path == '-':
+        return sys.stdin
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def file_format(path: Optional[str], requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    return 'csv' if path and path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_credentials(stream: TextIO, fmt: str) -> Iterator[Optional[Dict[str, str]]]:
+    """Учетные записи из JSON Lines или CSV (service,username,password)
+
+    Вместо неразборчивой строки JSON Lines выдается None.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+
+def ask_pin(value: Optional[str], prompt: str) -> str:
+    pin = value or getpass.getpass(prompt)
+    if len(pin) != 4 or not pin.isdigit():
+        raise SystemExit("PIN должен быть 4 цифры")
+    return pin
+
+
+def cmd_stats(args):
+    started = time.perf_counter()
+    manager = open_manager(args.storage)
+    loaded = time.perf_counter()
+
+    services = entries = 0
+    usernames = set()
+    for service in manager.get_services():
+        services += 1
+        for entry in manager.passwords.get(service, ()):
+            entries += 1
+            usernames.add(username_key(entry.get('username', '')))
+
+    files = {}
+    for path in (vault.CONFIG_FILE, vault.JOURNAL_FILE, vault.SNAPSHOT_CACHE_FILE,
+                 vault.DATABASE_FILE, vault.KDF_SETTINGS_FILE):
+        if os.path.exists(path):
+            files[path] = os.path.getsize(path)
+
+    stats = {
+        'storage': vault.STORAGE_MODE,
+        'services': services,
+        'entries': entries,
+        'usernames': len(usernames),
+        'files': files,
+        'load_ms': round((loaded - started) * 1000, 1),
+        'scan_ms': round((time.perf_counter() - loaded) * 1000, 1),
+    }
+    print(json.dumps(stats, ensure_ascii=False, indent=2), file=args.stdout)
+
+
+def cmd_export(args):
+    manager = open_manager(args.storage)
+    fmt = file_format(args.output, args.format)
+    count = 0
+    out = open_output(args.output, args.stdout)
+    try:
+        if fmt == 'csv':
+            writer = csv.DictWriter(out, FIELDS)
+            writer.writeheader()
+        for fields in manager.iter_credentials():
+            if fmt == 'csv':
+                writer.writerow(fields)
+            else:
+                out.write(json.dumps(fields, ensure_ascii=False) + '\n')
+            count += 1
+    finally:
+        if out is not args.stdout:
+            out.close()
+    print(f"Экспортировано записей: {count} (пароли в открытом виде!)", file=sys.stderr)
+
+
+def cmd_import(args):
+    manager = open_manager(args.storage)
+    fmt = file_format(args.input, args.format)
+    count = skipped = 0
+    stream = open_input(args.input)
+    try:
+        for fields in read_credentials(stream, fmt):
+            if not isinstance(fields, dict) or not all(
+                    fields.get(name) and isinstance(fields[name], str) for name in FIELDS):
+                skipped += 1
+                continue
+            manager.add_password(fields['service'], fields['username'], fields['password'])
+            count += 1
+            if count % IMPORT_FLUSH_EVERY == 0:
+                manager.flush_passwords()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        # Записи после последнего сброса сохраняются и при ошибке
+        manager.drain()
+    print(f"Импортировано записей: {count}, пропущено: {skipped}", file=sys.stderr)
+
+
+def cmd_reencrypt(args):
+    """Перешифрование данных меток (по одной на строку) под новый PIN
+
+    Старые шифры расшифровываются параллельно, новые используют одну
+    соль на весь запуск, поэтому ключ нового PIN формируется один раз.
+    """
+    from Crypto.Random import get_random_bytes
+
+    old_pin = ask_pin(args.old_pin, "Старый PIN: ")
+    new_pin = ask_pin(args.new_pin, "Новый PIN: ")
+    salt = get_random_bytes(payload.SALT_SIZE)
+
+    stream = open_input(args.input)
+    out = open_output(args.output, args.stdout)
+    converted = failed = 0
+    try:
+        lines = (line.strip() for line in stream)
+        items = ((line, old_pin) for line in lines if line)
+        for credentials in EncryptionManager.ordered_map(EncryptionManager.decrypt_tag_entries, items):
+            if credentials is None:
+                failed += 1
+                continue
+            if len(credentials) == 1:
+                data = EncryptionManager.encrypt_credential(credentials[0], new_pin, salt=salt)
+            else:
+                data = EncryptionManager.seal(payload.encode_container(credentials),
+                                              payload.FLAG_CONTAINER, new_pin, salt=salt)
+            out.write(payload.payload_to_text(data) + '\n')
+            converted += 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not args.stdout:
+            out.close()
+    print(f"Перешифровано: {converted}, ошибок: {failed}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетные операции с хранилищем паролей")
+    parser.add_argument('--storage', choices=('json', 'journal', 'sqlite'),
+                        help="режим хранения (по умолчанию как в приложении)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="записать замеры времени в FILE (формат Chrome Trace)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help="статистика хранилища").set_defaults(func=cmd_stats)
+
+    export = commands.add_parser('export', help="экспорт записей")
+    export.add_argument('-o', '--output', help="файл (по умолчанию stdout)")
+    export.add_argument('--format', choices=('jsonl', 'csv'))
+    export.set_defaults(func=cmd_export)
+
+    imported = commands.add_parser('import', help="импорт записей")
+    imported.add_argument('input', nargs='?', help="файл (по умолчанию stdin)")
+    imported.add_argument('--format', choices=('jsonl', 'csv'))
+    imported.set_defaults(func=cmd_import)
+
+    reencrypt = commands.add_parser('reencrypt', help="перешифрование данных меток")
+    reencrypt.add_argument('-i', '--input', help="файл с данными меток (по умолчанию stdin)")
+    reencrypt.add_argument('-o', '--output', help="файл (по умолчанию stdout)")
+    reencrypt.add_argument('--old-pin')
+    reencrypt.add_argument('--new-pin')
+    reencrypt.set_defaults(func=cmd_reencrypt)
+
+    args = parser.parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    # Данные идут в stdout, сообщения модулей хранилища - в stderr
+    args.stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,146 +5,113 @@ NFC Password Manager - главное приложение
 
 import os
 import json
-import base64
-from datetime import datetime
+import time
+import functools
 from typing import Dict, List, Optional
 
-from kivy.app import App
-from kivy.uix.screenmanager import ScreenManager, Screen
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.button import Button
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.popup import Popup
-from kivy.clock import Clock
-from kivy.core.window import Window
-from kivy.utils import platform
+# Момент запуска для замера времени до первого кадра
+STARTUP_TIME = time.perf_counter()
 
-# Для шифрования
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-from Crypto.Random import get_random_bytes
-import hashlib
+import tracing
 
-# Импортируем NFC менеджер
-try:
-    from android_nfc import nfc_manager
-    from service import setup_intent_handler
-except ImportError:
-    # Заглушки для тестирования на ПК
-    class MockNFCManager:
-        def enable_foreground_dispatch(self): return True
+with tracing.span('import kivy', 'startup'):
+    from kivy.app import App
+    from kivy.uix.screenmanager import ScreenManager, Screen
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.label import Label
+    from kivy.uix.textinput import TextInput
+    from kivy.uix.button import Button
+    from kivy.uix.scrollview import ScrollView
+    from kivy.uix.recycleview import RecycleView
+    from kivy.uix.recycleboxlayout import RecycleBoxLayout
+    from kivy.uix.gridlayout import GridLayout
+    from kivy.uix.popup import Popup
+    from kivy.clock import Clock
+    from kivy.properties import StringProperty
+    from kivy.core.window import Window
+    from kivy.utils import platform
 
-        def disable_foreground_dispatch(self): pass
 
-        def is_nfc_available(self): return False
+class MockNFCManager:
+    """Заглушка для тестирования на ПК"""
 
-        def show_toast(self, msg): print(f"Toast: {msg}")
+    def enable_foreground_dispatch(self): return True
 
-        def open_nfc_settings(self): print("Открыть настройки NFC")
+    def disable_foreground_dispatch(self): pass
 
-        def process_intent(self, intent): return None
+    def is_nfc_available(self): return False
 
-        def write_to_tag(self, data, tag): return True
+    def show_toast(self, msg): print(f"Toast: {msg}")
 
-        def read_from_tag(self, tag): return None
+    def open_nfc_settings(self): print("Открыть настройки NFC")
 
+    def process_intent(self, intent): return None
 
-    nfc_manager = MockNFCManager()
+    def write_to_tag(self, data, tag): return True
 
+    def read_from_tag(self, tag): return None
 
-    def setup_intent_handler(callback):
-        print(f"Intent handler setup called with callback: {callback}")
-
-# Конфигурация
-CONFIG_FILE = 'nfc_passwords.json'
-MASTER_PIN = "1234"
+    def write_to_tag_async(self, data, tag, callback):
+        Clock.schedule_once(lambda dt: callback(self.write_to_tag(data, tag), None))
 
+    def read_from_tag_async(self, tag, callback):
+        Clock.schedule_once(lambda dt: callback(self.read_from_tag(tag), None))
 
-class PasswordManager:
-    """Менеджер паролей"""
+    def cancel(self, tag=None): pass
 
-    def __init__(self):
-        self.passwords = self.load_passwords()
-
-    def load_passwords(self) -> Dict:
-        """Загрузка паролей из файла"""
-        try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                # Создаем пустой файл при первом запуске
-                default_data = {}
-                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(default_data, f, indent=2, ensure_ascii=False)
-                return default_data
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Ошибка загрузки паролей: {e}")
-            return {}
-
-    def save_passwords(self):
-        """Сохранение паролей в файл"""
-        try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.passwords, f, indent=2, ensure_ascii=False)
-        except IOError as e:
-            print(f"Ошибка сохранения паролей: {e}")
+    def tag_uid(self, tag): return b''
 
-    def add_password(self, service: str, username: str, password: str):
-        """Добавление нового пароля"""
-        if service not in self.passwords:
-            self.passwords[service] = []
 
-        self.passwords[service].append({
-            'username': username,
-            'password': password,
-            'created': datetime.now().isoformat()
-        })
-        self.save_passwords()
+# NFC менеджер импортируется при первом обращении, а не при запуске
+nfc_manager = None
 
-    def get_services(self) -> List[str]:
-        """Получение списка сервисов"""
-        return list(self.passwords.keys())
 
+def get_nfc_manager():
+    """NFC менеджер: android_nfc, эмулятор меток или заглушка"""
+    global nfc_manager
+    if nfc_manager is not None:
+        return nfc_manager
 
-class EncryptionManager:
-    """Менеджер шифрования"""
+    # Эмуляция меток в памяти на ПК: NFC_SIMULATOR=1 python main.py
+    if platform != 'android' and os.environ.get('NFC_SIMULATOR'):
+        from nfc_simulator import SimulatedNFCManager
+        nfc_manager = SimulatedNFCManager()
+        return nfc_manager
 
-    @staticmethod
-    def derive_key(pin: str) -> bytes:
-        """Создание ключа из PIN"""
-        return hashlib.sha256(pin.encode()).digest()
+    try:
+        from android_nfc import nfc_manager as android_manager
+        nfc_manager = android_manager
+    except ImportError:
+        nfc_manager = MockNFCManager()
+    return nfc_manager
 
-    @staticmethod
-    def encrypt_data(data: str, pin: str) -> str:
-        """Шифрование данных"""
-        key = EncryptionManager.derive_key(pin)
-        iv = get_random_bytes(16)
-        cipher = AES.new(key, AES.MODE_CBC, iv)
 
-        encrypted = cipher.encrypt(pad(data.encode(), AES.block_size))
-        result = base64.b64encode(iv + encrypted).decode()
-        return result
+with tracing.span('import modules', 'startup'):
+    from storage import PersistenceWorker
+    from service import IntentDispatcher, setup_intent_handler
+    from vault import PasswordManager, EncryptionManager
+    import payload
+    import shards
 
-    @staticmethod
-    def decrypt_data(encrypted_data: str, pin: str) -> Optional[str]:
-        """Расшифрование данных"""
-        try:
-            key = EncryptionManager.derive_key(pin)
-            data = base64.b64decode(encrypted_data)
+# Результаты шифрования в фоне доставляются в главный поток
+EncryptionManager.scheduler = Clock
 
-            iv = data[:16]
-            encrypted = data[16:]
-
-            cipher = AES.new(key, AES.MODE_CBC, iv)
-            decrypted = unpad(cipher.decrypt(encrypted), AES.block_size)
-            return decrypted.decode()
-        except Exception as e:
-            print(f"Ошибка дешифровки: {e}")
-            return None
+# Конфигурация
+MASTER_PIN = "1234"
+# Тип метки по умолчанию для записи нескольких учетных записей
+DEFAULT_TAG_TYPE = 'NTAG216'
+# Части резервной копии, собранные с меток, и число частей четности
+SHARDS_FILE = 'nfc_shards.json'
+SHARD_PARITY = 1
+# Задержка инициализации адаптера NFC после первого кадра (сек)
+NFC_INIT_DELAY = 0.5
+# Сообщения об ошибках операций с метками (см. android_nfc.NFCWorker)
+NFC_ERROR_MESSAGES = {
+    'timeout': 'Метка не ответила вовремя',
+    'tag_lost': 'Метка убрана слишком рано',
+    'cancelled': 'Операция отменена',
+    'busy': 'Подождите завершения предыдущей операции',
+}
 
 
 class LoginScreen(Screen):
@@ -218,6 +185,24 @@ class LoginScreen(Screen):
         self.error_label.text = ""
 
 
+class ServiceButton(Button):
+    """Строка списка сервисов (переиспользуется RecycleView)"""
+
+    service = StringProperty('')
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            background_color=(0.3, 0.3, 0.5, 1),
+            color=(1, 1, 1, 1),
+            font_size=18,
+            **kwargs
+        )
+
+    def on_release(self):
+        main_screen = App.get_running_app().screen_manager.get_screen('main')
+        main_screen.show_service_details(self.service)
+
+
 class MainScreen(Screen):
     """Главный экран"""
 
@@ -243,12 +228,52 @@ class MainScreen(Screen):
         top_bar.add_widget(title)
         top_bar.add_widget(logout_btn)
 
-        # Список сервисов
-        self.services_layout = GridLayout(cols=1, spacing=5, size_hint_y=None, padding=10)
-        self.services_layout.bind(minimum_height=self.services_layout.setter('height'))
+        # Список сервисов: виджеты создаются только для видимых строк
+        self.services_view = RecycleView(viewclass=ServiceButton)
+        services_layout = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, 60),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+            spacing=5,
+            padding=10
+        )
+        services_layout.bind(minimum_height=services_layout.setter('height'))
+        self.services_view.add_widget(services_layout)
+
+        self.empty_label = Label(
+            text='Нет сохраненных паролей\n\nНажмите "[ Запись NFC ]"\nчтобы добавить первый пароль',
+            color=(0.7, 0.7, 0.7, 1),
+            halign='center',
+            valign='middle'
+        )
+        self.empty_label.bind(size=self.empty_label.setter('text_size'))
+
+        # Поиск по сервисам и логинам
+        self.search_input = TextInput(
+            hint_text='Поиск сервиса или логина',
+            hint_text_color=(0.7, 0.7, 0.7, 1),
+            multiline=False,
+            size_hint_y=0.08,
+            background_color=(0.2, 0.2, 0.2, 1),
+            foreground_color=(1, 1, 1, 1),
+            cursor_color=(1, 1, 1, 1)
+        )
+        self.search_input.bind(text=self.on_search_text)
+        self.search_query = ''
+
+        # Фильтр "где используется логин", показывается только когда активен
+        self.username_filter = None
+        self.filter_btn = Button(
+            size_hint_y=0.06,
+            background_color=(0.4, 0.4, 0.6, 1),
+            color=(1, 1, 1, 1)
+        )
+        self.filter_btn.bind(on_release=lambda x: self.set_username_filter(None))
 
-        scroll = ScrollView(size_hint=(1, 0.7))
-        scroll.add_widget(self.services_layout)
+        # Контейнер показывает либо список, либо подсказку
+        self.list_container = BoxLayout(size_hint=(1, 0.62))
+        self.list_container.add_widget(self.services_view)
 
         # Нижняя панель с кнопками
         bottom_bar = BoxLayout(size_hint_y=0.18, spacing=15, padding=10)
@@ -273,46 +298,98 @@ class MainScreen(Screen):
         bottom_bar.add_widget(read_btn)
 
         self.layout.add_widget(top_bar)
-        self.layout.add_widget(scroll)
+        self.layout.add_widget(self.search_input)
+        self.layout.add_widget(self.list_container)
         self.layout.add_widget(bottom_bar)
 
         self.add_widget(self.layout)
 
+        # Позиции сервисов в services_view.data для точечных обновлений
+        self.service_positions = {}
+        # Список нужно перестроить целиком при следующем показе
+        self.invalidated = True
+        App.get_running_app().password_manager.add_change_listener(self.on_vault_changed)
+
     def on_enter(self):
         """Обновление списка сервисов при входе"""
-        self.update_service_list()
+        if self.invalidated:
+            self.update_service_list()
 
     def update_service_list(self):
         """Обновление списка сервисов"""
         app = App.get_running_app()
-        services = app.password_manager.get_services()
+        if self.username_filter:
+            services = app.password_manager.get_services_for_username(self.username_filter)
+            if self.search_query:
+                query = self.search_query.casefold()
+                services = [s for s in services if query in s.casefold()]
+        elif self.search_query:
+            services = app.password_manager.search(self.search_query)
+        else:
+            services = app.password_manager.get_services()
+
+        self.service_positions = {service: i for i, service in enumerate(services)}
+        self.services_view.data = [self.service_row(service) for service in services]
+        # Подсказку о пустом хранилище показываем только без фильтра
+        filtered = self.search_query or self.username_filter
+        self.show_empty_hint(not services and not filtered)
+        self.invalidated = False
+
+    def set_username_filter(self, username: Optional[str]):
+        """Показать только сервисы с этим логином (None - сбросить)"""
+        self.username_filter = username
+        if username:
+            self.filter_btn.text = f'Логин: {username}   [ x ]'
+            if self.filter_btn.parent is None:
+                # Между полем поиска и списком
+                self.layout.add_widget(self.filter_btn, index=2)
+        elif self.filter_btn.parent is not None:
+            self.layout.remove_widget(self.filter_btn)
+        self.update_service_list()
 
-        self.services_layout.clear_widgets()
+    def on_search_text(self, instance, text: str):
+        """Поиск по мере ввода"""
+        self.search_query = text.strip()
+        self.update_service_list()
 
-        if not services:
-            label = Label(
-                text='Нет сохраненных паролей\n\nНажмите "[ Запись NFC ]"\nчтобы добавить первый пароль',
-                size_hint_y=None,
-                height=150,
-                color=(0.7, 0.7, 0.7, 1),
-                halign='center',
-                valign='middle'
-            )
-            label.bind(size=label.setter('text_size'))
-            self.services_layout.add_widget(label)
+    @staticmethod
+    def service_row(service: str) -> Dict:
+        return {'text': f'● {service}', 'service': service}
+
+    def on_vault_changed(self, event: str, service: Optional[str]):
+        """Точечное обновление списка по событию хранилища"""
+        if event == 'reset':
+            self.invalidated = True
+            if self.manager and self.manager.current == self.name:
+                self.update_service_list()
             return
 
-        for service in services:
-            btn = Button(
-                text=f'● {service}',
-                size_hint_y=None,
-                height=60,
-                background_color=(0.3, 0.3, 0.5, 1),
-                color=(1, 1, 1, 1),
-                font_size=18
-            )
-            btn.bind(on_release=lambda x, s=service: self.show_service_details(s))
-            self.services_layout.add_widget(btn)
+        # Список и так будет перестроен при входе
+        if self.invalidated:
+            return
+
+        # Результаты поиска дешевле пересчитать, чем сопоставлять
+        if self.search_query or self.username_filter:
+            self.update_service_list()
+            return
+        if event == 'indexed':
+            return
+
+        data = self.services_view.data
+        if event == 'added' and service not in self.service_positions:
+            self.service_positions[service] = len(data)
+            data.append(self.service_row(service))
+            self.show_empty_hint(False)
+        elif event == 'updated' and service in self.service_positions:
+            position = self.service_positions[service]
+            data[position] = self.service_row(service)
+
+    def show_empty_hint(self, empty: bool):
+        """Переключение между списком и подсказкой о пустом хранилище"""
+        widget = self.empty_label if empty else self.services_view
+        if widget.parent is not self.list_container:
+            self.list_container.clear_widgets()
+            self.list_container.add_widget(widget)
 
     def show_service_details(self, service: str):
         """Показать детали сервиса"""
@@ -330,6 +407,10 @@ class MainScreen(Screen):
         scroll_content = GridLayout(cols=1, spacing=5, size_hint_y=None)
         scroll_content.bind(minimum_height=scroll_content.setter('height'))
 
+        def show_usage(username):
+            popup.dismiss()
+            self.set_username_filter(username)
+
         if not passwords:
             scroll_content.add_widget(Label(
                 text='Нет сохраненных паролей',
@@ -337,7 +418,7 @@ class MainScreen(Screen):
             ))
 
         for i, pwd in enumerate(passwords, 1):
-            entry_box = BoxLayout(orientation='vertical', spacing=2, size_hint_y=None, height=80)
+            entry_box = BoxLayout(orientation='vertical', spacing=2, size_hint_y=None, height=115)
 
             user_label = Label(
                 text=f'Логин: {pwd["username"]}',
@@ -356,7 +437,7 @@ class MainScreen(Screen):
             pass_label.bind(size=pass_label.setter('text_size'))
 
             date_label = Label(
-                text=f'Дата: {pwd["created"][:10]}',
+                text=f'Дата: {pwd.get("updated", pwd["created"])[:10]}',
                 color=(0.5, 0.5, 0.5, 1),
                 font_size=12,
                 halign='left',
@@ -364,9 +445,18 @@ class MainScreen(Screen):
             )
             date_label.bind(size=date_label.setter('text_size'))
 
+            usage_btn = Button(
+                text='Где еще этот логин',
+                size_hint_y=0.3,
+                background_color=(0.4, 0.4, 0.6, 1),
+                color=(1, 1, 1, 1)
+            )
+            usage_btn.bind(on_release=lambda x, u=pwd['username']: show_usage(u))
+
             entry_box.add_widget(user_label)
             entry_box.add_widget(pass_label)
             entry_box.add_widget(date_label)
+            entry_box.add_widget(usage_btn)
             scroll_content.add_widget(entry_box)
 
         scroll_view = ScrollView(size_hint=(1, 0.7))
@@ -392,6 +482,7 @@ class MainScreen(Screen):
         popup.open()
 
     def logout(self, instance):
+        EncryptionManager.clear_key_cache()
         self.manager.current = 'login'
 
     def go_to_write(self, instance):
@@ -407,8 +498,17 @@ class WriteNFCScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        # Данные для записи
+        # Данные для записи (бинарный формат метки)
         self.encrypted_data_to_write = None
+        self.legacy_size = 0
+        self.tag_type = DEFAULT_TAG_TYPE
+        # Части резервной копии, ожидающие записи, по одной на метку
+        self.shards_to_write = []
+        self.shard_position = 0
+        # UID метки -> номер части этой копии, уже записанной на нее
+        self.shard_tags: Dict[bytes, int] = {}
+        # Идет запись на метку в потоке NFC
+        self.write_pending = False
 
         self.layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
@@ -487,9 +587,36 @@ class WriteNFCScreen(Screen):
         )
         write_btn.bind(on_release=self.prepare_data_for_write)
 
+        # Несколько учетных записей на одну метку
+        pack_layout = BoxLayout(size_hint_y=0.1, spacing=10)
+        self.tag_type_btn = Button(
+            text=f'Метка: {self.tag_type}',
+            size_hint_x=0.4,
+            background_color=(0.4, 0.4, 0.6, 1),
+            color=(1, 1, 1, 1)
+        )
+        self.tag_type_btn.bind(on_release=self.switch_tag_type)
+        pack_btn = Button(
+            text='Несколько записей на метку',
+            background_color=(0.2, 0.6, 0.4, 1),
+            color=(1, 1, 1, 1)
+        )
+        pack_btn.bind(on_release=self.prepare_container_for_write)
+        backup_btn = Button(
+            text='Копия на метки',
+            size_hint_x=0.5,
+            background_color=(0.6, 0.4, 0.2, 1),
+            color=(1, 1, 1, 1)
+        )
+        backup_btn.bind(on_release=self.prepare_backup_for_write)
+        pack_layout.add_widget(self.tag_type_btn)
+        pack_layout.add_widget(pack_btn)
+        pack_layout.add_widget(backup_btn)
+
         self.layout.add_widget(top_bar)
         self.layout.add_widget(form_layout)
         self.layout.add_widget(write_btn)
+        self.layout.add_widget(pack_layout)
 
         self.add_widget(self.layout)
 
@@ -497,12 +624,12 @@ class WriteNFCScreen(Screen):
         """При входе на экран включить NFC"""
         print("Вход на экран записи NFC")
         if platform == 'android':
-            if not nfc_manager.is_nfc_available():
+            if not get_nfc_manager().is_nfc_available():
                 self.show_message("Включите NFC в настройках устройства!", (1, 0.3, 0.3, 1))
                 # Показать предупреждение через секунду
                 Clock.schedule_once(self.show_nfc_warning, 1)
             else:
-                success = nfc_manager.enable_foreground_dispatch()
+                success = get_nfc_manager().enable_foreground_dispatch()
                 if success:
                     self.show_message("Готово к записи. Поднесите NFC метку", (0.3, 1, 0.3, 1))
                 else:
@@ -513,7 +640,7 @@ class WriteNFCScreen(Screen):
     def on_leave(self):
         """При выходе с экрана отключить NFC"""
         if platform == 'android':
-            nfc_manager.disable_foreground_dispatch()
+            get_nfc_manager().disable_foreground_dispatch()
 
     def show_nfc_warning(self, dt):
         """Показать предупреждение о выключенном NFC"""
@@ -533,7 +660,7 @@ class WriteNFCScreen(Screen):
         cancel_btn = Button(text='Позже')
 
         def open_settings(instance):
-            nfc_manager.open_nfc_settings()
+            get_nfc_manager().open_nfc_settings()
             popup.dismiss()
 
         settings_btn.bind(on_release=open_settings)
@@ -572,53 +699,228 @@ class WriteNFCScreen(Screen):
         app.password_manager.add_password(service, username, password)
 
         # Подготовка данных для записи
-        data_to_write = json.dumps({
+        fields = {
             'service': service,
             'username': username,
             'password': password
-        })
+        }
+        # Размер тех же данных в старом формате (JSON + base64) для сравнения
+        self.legacy_size = payload.legacy_payload_size(len(json.dumps(fields)))
 
-        # Шифрование данных
-        encrypted_data = EncryptionManager.encrypt_data(data_to_write, pin)
+        # Шифрование данных в фоне: формирование ключа занимает заметное время
+        self.encrypted_data_to_write = None
+        self.shards_to_write = []
+        self.show_message("Шифрование...", (1, 1, 0.3, 1))
+        EncryptionManager.run_async(EncryptionManager.encrypt_credential,
+                                    self.on_data_encrypted, fields, pin)
+
+    def on_data_encrypted(self, encrypted_data: Optional[bytes]):
+        """Данные зашифрованы"""
+        if not encrypted_data:
+            self.show_message("ОШИБКА ШИФРОВАНИЯ", (1, 0.3, 0.3, 1))
+            return
 
         # Сохраняем данные для записи
         self.encrypted_data_to_write = encrypted_data
+        size_info = f"Размер: {len(encrypted_data)} байт (старый формат: {self.legacy_size})"
+        print(size_info)
 
         # Показываем результат
         self.show_message(
             f"Данные подготовлены!\n\n"
             f"Поднесите NFC метку к телефону\n"
             f"для записи данных.\n\n"
-            f"Шифр (первые 30 символов):\n{encrypted_data[:30]}...",
+            f"{size_info}",
             (0.3, 1, 0.3, 1)
         )
 
-        # Обновление списка на главном экране
-        Clock.schedule_once(lambda dt: self.update_main_screen(), 1)
-
         # Если не Android, эмулируем запись
         if platform != 'android':
-            self.show_message("Эмуляция: Данные готовы к записи", (0.3, 1, 0.3, 1))
-            print(f"Данные для записи: {encrypted_data}")
+            self.show_message(f"Эмуляция: Данные готовы к записи\n{size_info}", (0.3, 1, 0.3, 1))
+            print(f"Данные для записи: {payload.payload_to_text(encrypted_data)}")
+
+    def switch_tag_type(self, instance):
+        """Следующий тип метки"""
+        tag_types = list(payload.TAG_CAPACITIES)
+        self.tag_type = tag_types[(tag_types.index(self.tag_type) + 1) % len(tag_types)]
+        self.tag_type_btn.text = f'Метка: {self.tag_type}'
+
+    def prepare_container_for_write(self, instance):
+        """Подготовка нескольких записей из хранилища для одной метки
+
+        Поле сервиса задает поиск: найденные записи идут в порядке
+        релевантности, без запроса на метку попадает как можно больше записей.
+        """
+        query = self.service_input.text.strip()
+        pin = self.pin_input.text.strip()
+        if len(pin) != 4 or not pin.isdigit():
+            self.show_message("ОШИБКА: PIN должен быть 4 цифры!", (1, 0.3, 0.3, 1))
+            return
+
+        manager = App.get_running_app().password_manager
+        services = manager.search(query, limit=1000) if query else None
+        credentials = list(manager.iter_credentials(services))
+        if not credentials:
+            self.show_message("Нет записей для упаковки", (1, 1, 0.3, 1))
+            return
+
+        # Ценность убывает с позицией в результатах поиска
+        values = list(range(len(credentials), 0, -1)) if query else None
+        capacity = payload.TAG_CAPACITIES[self.tag_type]
+
+        self.encrypted_data_to_write = None
+        self.shards_to_write = []
+        self.show_message("Подбор записей и шифрование...", (1, 1, 0.3, 1))
+        EncryptionManager.run_async(self.build_container, self.on_container_encrypted,
+                                    credentials, values, capacity, pin)
+
+    @staticmethod
+    def build_container(credentials, values, capacity, pin):
+        """Выбор записей под емкость метки и шифрование (в фоне)"""
+        chosen = payload.pack_credentials(credentials, capacity, values)
+        if not chosen:
+            return None
+        data = EncryptionManager.encrypt_container([credentials[i] for i in chosen], pin)
+        return data, len(chosen), len(credentials)
+
+    def on_container_encrypted(self, result):
+        """Контейнер зашифрован: (данные, записей в нем, всего записей)"""
+        if not result:
+            self.show_message("ОШИБКА: записи не помещаются на метку", (1, 0.3, 0.3, 1))
+            return
+
+        data, packed, total = result
+        self.encrypted_data_to_write = data
+        capacity = payload.tag_payload_capacity(payload.TAG_CAPACITIES[self.tag_type])
+        size_info = f"Записей: {packed} из {total}, размер: {len(data)} из {capacity} байт"
+        print(size_info)
+        self.show_message(
+            f"Данные подготовлены!\n\n"
+            f"Поднесите метку {self.tag_type} к телефону\n\n"
+            f"{size_info}",
+            (0.3, 1, 0.3, 1)
+        )
+
+    def prepare_backup_for_write(self, instance):
+        """Резервная копия всего хранилища на несколько меток"""
+        pin = self.pin_input.text.strip()
+        if len(pin) != 4 or not pin.isdigit():
+            self.show_message("ОШИБКА: PIN должен быть 4 цифры!", (1, 0.3, 0.3, 1))
+            return
+
+        credentials = list(App.get_running_app().password_manager.iter_credentials())
+        if not credentials:
+            self.show_message("Хранилище пусто", (1, 1, 0.3, 1))
+            return
+
+        self.encrypted_data_to_write = None
+        self.shards_to_write = []
+        self.show_message("Шифрование копии...", (1, 1, 0.3, 1))
+        capacity = payload.TAG_CAPACITIES[self.tag_type]
+        EncryptionManager.run_async(self.build_backup, self.on_backup_ready,
+                                    credentials, capacity, pin)
+
+    @staticmethod
+    def build_backup(credentials, capacity, pin) -> List[bytes]:
+        """Шифрование хранилища и деление на части под емкость метки (в фоне)"""
+        blob = EncryptionManager.encrypt_container(credentials, pin)
+        body_size = payload.tag_payload_capacity(capacity) - shards.SHARD_HEADER.size
+        return shards.split_blob(blob, body_size, SHARD_PARITY)
+
+    def on_backup_ready(self, backup: Optional[List[bytes]]):
+        """Части копии готовы к записи"""
+        if not backup:
+            self.show_message("ОШИБКА ПОДГОТОВКИ КОПИИ", (1, 0.3, 0.3, 1))
+            return
+        self.shards_to_write = backup
+        self.shard_position = 0
+        self.shard_tags = {}
+        print(f"Копия: {len(backup)} частей по {max(map(len, backup))} байт")
+        self.show_shard_prompt()
+
+    def show_shard_prompt(self):
+        """Приглашение записать следующую часть копии"""
+        position, total = self.shard_position + 1, len(self.shards_to_write)
+        self.show_message(
+            f"Копия хранилища: метка {position} из {total}\n"
+            f"(частей четности: {min(SHARD_PARITY, total - 1)})\n\n"
+            f"Поднесите метку {self.tag_type} к телефону",
+            (0.3, 1, 0.3, 1)
+        )
+
+    def on_shard_written(self, uid: bytes, success: bool, error: Optional[str]):
+        """Часть копии записана на метку uid"""
+        self.write_pending = False
+        if not self.shards_to_write:
+            return
+        if not success:
+            reason = NFC_ERROR_MESSAGES.get(error, 'ОШИБКА ЗАПИСИ НА МЕТКУ')
+            self.show_message(f"{reason}\nПоднесите метку еще раз", (1, 0.3, 0.3, 1))
+            return
+
+        if uid:
+            self.shard_tags[uid] = self.shard_position
+        self.shard_position += 1
+        if self.shard_position < len(self.shards_to_write):
+            get_nfc_manager().show_toast(f"Часть {self.shard_position} записана")
+            self.show_shard_prompt()
+            return
+
+        total = len(self.shards_to_write)
+        self.shards_to_write = []
+        self.shard_position = 0
+        self.shard_tags = {}
+        self.show_message(f"КОПИЯ ЗАПИСАНА НА {total} МЕТОК!", (0.3, 1, 0.3, 1))
+        get_nfc_manager().show_toast("Резервная копия записана!")
 
     def process_nfc_intent(self, intent):
         """Обработка NFC Intent для записи"""
+        if self.write_pending:
+            return
+
+        if self.shards_to_write:
+            tag = get_nfc_manager().process_intent(intent)
+            if not tag:
+                return
+            # Повторное касание метки с уже записанной частью затерло бы ее
+            uid = get_nfc_manager().tag_uid(tag)
+            if uid in self.shard_tags:
+                self.show_message(
+                    f"На этой метке уже часть {self.shard_tags[uid] + 1} копии\n"
+                    f"Поднесите другую метку для части {self.shard_position + 1}",
+                    (1, 0.3, 0.3, 1)
+                )
+                return
+            # Запись в потоке NFC, результат в on_shard_written
+            self.write_pending = True
+            shard = self.shards_to_write[self.shard_position]
+            get_nfc_manager().write_to_tag_async(shard, tag,
+                                                 functools.partial(self.on_shard_written, uid))
+            return
+
         if not self.encrypted_data_to_write:
             self.show_message("Сначала подготовьте данные для записи", (1, 1, 0.3, 1))
             return
 
-        tag = nfc_manager.process_intent(intent)
+        tag = get_nfc_manager().process_intent(intent)
         if tag:
-            success = nfc_manager.write_to_tag(self.encrypted_data_to_write, tag)
-            if success:
-                self.show_message("ДАННЫЕ ЗАПИСАНЫ НА NFC МЕТКУ!", (0.3, 1, 0.3, 1))
-                nfc_manager.show_toast("Данные записаны успешно!")
-
-                # Очищаем данные
-                self.encrypted_data_to_write = None
-                self.clear_fields(None)
-            else:
-                self.show_message("ОШИБКА ЗАПИСИ НА МЕТКУ", (1, 0.3, 0.3, 1))
+            self.write_pending = True
+            self.show_message("Запись на метку...", (1, 1, 0.3, 1))
+            get_nfc_manager().write_to_tag_async(self.encrypted_data_to_write, tag, self.on_tag_written)
+
+    def on_tag_written(self, success: bool, error: Optional[str]):
+        """Запись на метку завершена"""
+        self.write_pending = False
+        if success:
+            self.show_message("ДАННЫЕ ЗАПИСАНЫ НА NFC МЕТКУ!", (0.3, 1, 0.3, 1))
+            get_nfc_manager().show_toast("Данные записаны успешно!")
+
+            # Очищаем данные
+            self.encrypted_data_to_write = None
+            self.clear_fields(None)
+        else:
+            reason = NFC_ERROR_MESSAGES.get(error, '')
+            self.show_message(f"ОШИБКА ЗАПИСИ НА МЕТКУ\n{reason}", (1, 0.3, 0.3, 1))
 
     def clear_fields(self, dt):
         """Очистка полей ввода"""
@@ -632,11 +934,6 @@ class WriteNFCScreen(Screen):
         self.status_label.text = message
         self.status_label.color = color
 
-    def update_main_screen(self):
-        """Обновление главного экрана"""
-        main_screen = self.manager.get_screen('main')
-        main_screen.update_service_list()
-
     def go_back(self, instance):
         self.manager.current = 'main'
 
@@ -767,14 +1064,22 @@ class ReadNFCScreen(Screen):
 
         self.add_widget(self.layout)
 
+        # Сбор частей резервной копии, создается при первой части
+        self.shard_collector = None
+        self.assembled_backup = None
+        # UID метки, с которой считаны данные в поле ввода
+        self.reading_uid = b''
+        self.source_uid = b''
+        self.source_text = None
+
     def on_enter(self):
         """При входе на экран включить NFC"""
         print("Вход на экран чтения NFC")
         if platform == 'android':
-            if not nfc_manager.is_nfc_available():
+            if not get_nfc_manager().is_nfc_available():
                 self.show_message("Включите NFC в настройках устройства!", (1, 0.3, 0.3, 1))
             else:
-                success = nfc_manager.enable_foreground_dispatch()
+                success = get_nfc_manager().enable_foreground_dispatch()
                 if success:
                     self.show_message("Готово к чтению. Поднесите NFC метку", (0.3, 1, 0.3, 1))
                 else:
@@ -785,32 +1090,84 @@ class ReadNFCScreen(Screen):
     def on_leave(self):
         """При выходе с экрана отключить NFC"""
         if platform == 'android':
-            nfc_manager.disable_foreground_dispatch()
+            get_nfc_manager().disable_foreground_dispatch()
 
     def process_nfc_intent(self, intent):
         """Обработка NFC Intent для чтения"""
-        tag = nfc_manager.process_intent(intent)
+        tag = get_nfc_manager().process_intent(intent)
         if tag:
-            data = nfc_manager.read_from_tag(tag)
-            if data:
-                self.data_input.text = data
-                self.show_message("ДАННЫЕ СЧИТАНЫ С NFC МЕТКИ!\nВведите PIN и нажмите 'РАСШИФРОВАТЬ ДАННЫЕ'",
-                                  (0.3, 1, 0.3, 1))
-                nfc_manager.show_toast("Данные считаны успешно!")
-            else:
-                self.show_message("НЕ УДАЛОСЬ СЧИТАТЬ ДАННЫЕ С МЕТКИ", (1, 0.3, 0.3, 1))
+            # Чтение в потоке NFC, результат в on_tag_read
+            self.reading_uid = get_nfc_manager().tag_uid(tag)
+            get_nfc_manager().read_from_tag_async(tag, self.on_tag_read)
+
+    def on_tag_read(self, data: Optional[bytes], error: Optional[str]):
+        """Данные метки считаны"""
+        if error == 'duplicate':
+            # Повтор пропускается, только если эти данные уже на экране
+            if (self.reading_uid == self.source_uid
+                    and payload.payload_to_text(data) == self.data_input.text.strip()):
+                return
+            error = None
+        if data and shards.is_shard(data):
+            self.add_shard(data)
+        elif data:
+            # Бинарный формат показывается в base64
+            self.data_input.text = payload.payload_to_text(data)
+            self.remember_source(self.reading_uid)
+            self.show_message("ДАННЫЕ СЧИТАНЫ С NFC МЕТКИ!\nВведите PIN и нажмите 'РАСШИФРОВАТЬ ДАННЫЕ'",
+                              (0.3, 1, 0.3, 1))
+            get_nfc_manager().show_toast("Данные считаны успешно!")
+        else:
+            reason = NFC_ERROR_MESSAGES.get(error, '')
+            self.show_message(f"НЕ УДАЛОСЬ СЧИТАТЬ ДАННЫЕ С МЕТКИ\n{reason}", (1, 0.3, 0.3, 1))
+
+    def add_shard(self, data: bytes):
+        """Часть резервной копии: сбор, при наличии всех частей - сборка"""
+        if self.shard_collector is None:
+            self.shard_collector = shards.ShardCollector(SHARDS_FILE)
+        collector = self.shard_collector
+        try:
+            backup_id = collector.add(data)
+            if not collector.is_complete(backup_id):
+                collected, needed = collector.progress(backup_id)
+                missing = ', '.join(str(index + 1) for index in collector.missing(backup_id))
+                self.show_message(f"Часть копии считана: {collected} из {needed}\n"
+                                  f"Не хватает меток: {missing}", (1, 1, 0.3, 1))
+                return
+            blob = collector.assemble(backup_id)
+        except ValueError as e:
+            print(f"Ошибка части копии: {e}")
+            self.show_message(f"ОШИБКА: {e}", (1, 0.3, 0.3, 1))
+            return
+
+        self.assembled_backup = backup_id
+        self.data_input.text = payload.payload_to_text(blob)
+        self.remember_source(bytes.fromhex(backup_id))
+        self.show_message("КОПИЯ СОБРАНА!\nВведите PIN и нажмите 'РАСШИФРОВАТЬ ДАННЫЕ'",
+                          (0.3, 1, 0.3, 1))
+        get_nfc_manager().show_toast("Все части копии считаны")
+
+    def remember_source(self, uid: bytes):
+        """Данные в поле ввода считаны с метки uid"""
+        self.source_uid = uid
+        self.source_text = self.data_input.text.strip()
 
     def insert_test_data(self, instance):
         """Вставить тестовые данные для демонстрации"""
         # Создаем тестовые данные
-        test_data = json.dumps({
+        test_data = {
             'service': 'example.com',
             'username': 'demo_user',
             'password': 'demo123'
-        })
-        test_encrypted = EncryptionManager.encrypt_data(test_data, "1234")
+        }
+        EncryptionManager.run_async(EncryptionManager.encrypt_credential,
+                                    self.on_test_data_encrypted, test_data, "1234")
 
-        self.data_input.text = test_encrypted
+    def on_test_data_encrypted(self, test_encrypted: Optional[bytes]):
+        """Тестовые данные зашифрованы"""
+        if not test_encrypted:
+            return
+        self.data_input.text = payload.payload_to_text(test_encrypted)
         self.pin_input.text = "1234"
         self.show_message("Тестовые данные загружены! Нажмите 'РАСШИФРОВАТЬ ДАННЫЕ'", (0.3, 1, 0.3, 1))
 
@@ -832,35 +1189,64 @@ class ReadNFCScreen(Screen):
             self.show_message("ВНИМАНИЕ: Введите данные или нажмите 'Вставить тестовые данные'", (1, 1, 0.3, 1))
             return
 
-        # Расшифровка данных
-        decrypted = EncryptionManager.decrypt_data(encrypted_data, pin)
+        # Повторно считанная метка берется из кэша без расшифровки
+        uid = self.source_uid if encrypted_data == self.source_text else b''
+        cached = EncryptionManager.read_cache.lookup(uid, encrypted_data, pin)
+        if cached is not None:
+            self.on_data_decrypted(None, cached)
+            return
+
+        # Расшифровка данных в фоне, формат определяется автоматически.
+        # Ключ кэша привязан к запросу: до его завершения может начаться следующий
+        self.show_message("Расшифровка...", (1, 1, 0.3, 1))
+        EncryptionManager.run_async(EncryptionManager.decrypt_tag_entries,
+                                    functools.partial(self.on_data_decrypted, (uid, encrypted_data, pin)),
+                                    encrypted_data, pin)
 
-        if decrypted:
-            try:
-                data = json.loads(decrypted)
+    def on_data_decrypted(self, cache_key: Optional[tuple], credentials: Optional[List[Dict[str, str]]]):
+        """Данные расшифрованы (None - неверный PIN или повреждены)
+
+        cache_key - (UID, данные, PIN) запроса для кэша или None.
+        """
+        if credentials and cache_key is not None:
+            EncryptionManager.read_cache.store(*cache_key, credentials)
 
+        if credentials:
+            try:
                 # Форматируем результат
-                result = f"УСПЕШНО РАСШИФРОВАНО!\n\n"
-                result += f"Сервис: {data['service']}\n"
-                result += f"Пользователь: {data['username']}\n"
-                result += f"Пароль: {data['password']}\n\n"
+                if len(credentials) == 1:
+                    data = credentials[0]
+                    result = f"УСПЕШНО РАСШИФРОВАНО!\n\n"
+                    result += f"Сервис: {data['service']}\n"
+                    result += f"Пользователь: {data['username']}\n"
+                    result += f"Пароль: {data['password']}\n\n"
+                else:
+                    result = f"УСПЕШНО РАСШИФРОВАНО! Записей: {len(credentials)}\n\n"
+                    for data in credentials[:5]:
+                        result += f"{data['service']}: {data['username']}\n"
+                    if len(credentials) > 5:
+                        result += f"... и еще {len(credentials) - 5}\n"
+                    result += "\n"
                 result += f"Данные сохранены в менеджер паролей"
 
-                self.result_text.text = result
-                self.show_message("Данные успешно расшифрованы и сохранены!", (0.3, 1, 0.3, 1))
-
                 # Добавление в менеджер паролей
                 app = App.get_running_app()
-                app.password_manager.add_password(
-                    data['service'],
-                    data['username'],
-                    data['password']
-                )
+                for data in credentials:
+                    app.password_manager.add_password(
+                        data['service'],
+                        data['username'],
+                        data['password']
+                    )
+
+                self.result_text.text = result
+                self.show_message("Данные успешно расшифрованы и сохранены!", (0.3, 1, 0.3, 1))
 
-                # Обновление списка на главном экране
-                Clock.schedule_once(lambda dt: self.update_main_screen(), 1)
+                # Собранная копия больше не нужна
+                if self.assembled_backup is not None:
+                    self.shard_collector.discard(self.assembled_backup)
+                    self.assembled_backup = None
 
-            except json.JSONDecodeError:
+            except KeyError:
                 self.result_text.text = "ОШИБКА: неверный формат данных"
                 self.show_message("ОШИБКА: Не удалось распарсить данные", (1, 0.3, 0.3, 1))
         else:
@@ -872,63 +1258,96 @@ class ReadNFCScreen(Screen):
         self.status_label.text = message
         self.status_label.color = color
 
-    def update_main_screen(self):
-        """Обновление главного экрана"""
-        main_screen = self.manager.get_screen('main')
-        main_screen.update_service_list()
-
     def go_back(self, instance):
         self.manager.current = 'main'
 
 
+class LazyScreenManager(ScreenManager):
+    """ScreenManager, создающий экраны при первом переходе на них"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Имя экрана -> класс еще не созданного экрана
+        self.screen_factories: Dict[str, type] = {}
+        self.built_callback = None
+
+    def register_screen(self, name: str, factory):
+        self.screen_factories[name] = factory
+
+    def build_screen(self, name: str):
+        factory = self.screen_factories.pop(name, None)
+        if factory is None:
+            return
+        started = time.perf_counter()
+        screen = factory(name=name)
+        self.add_widget(screen)
+        print(f"Экран {name} создан за {(time.perf_counter() - started) * 1000:.0f} мс")
+        if self.built_callback:
+            self.built_callback(screen)
+
+    def get_screen(self, name):
+        # Через get_screen проходит и переход (смена current)
+        self.build_screen(name)
+        return super().get_screen(name)
+
+
 class NFCPasswordManagerApp(App):
     """Главное приложение"""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.password_manager = PasswordManager()
-        self.screen_manager = ScreenManager()
+        self.persistence_worker = PersistenceWorker(schedule=Clock.schedule_once)
+        self.password_manager = PasswordManager(worker=self.persistence_worker, scheduler=Clock)
+        self.screen_manager = LazyScreenManager()
+        self.intent_dispatcher = IntentDispatcher(self.current_intent_target,
+                                                  schedule=Clock.schedule_once)
 
+    @tracing.traced('app.build', 'startup')
     def build(self):
-        """Сборка интерфейса"""
+        """Сборка интерфейса
+
+        Сразу создается только экран ввода PIN, остальные -
+        при первом переходе на них.
+        """
         # Настройка темного фона
         Window.clearcolor = (0.1, 0.1, 0.1, 1)
 
-        # Создание экранов
-        screens = {
-            'login': LoginScreen(name='login'),
-            'main': MainScreen(name='main'),
-            'write': WriteNFCScreen(name='write'),
-            'read': ReadNFCScreen(name='read')
-        }
-
-        for name, screen in screens.items():
-            self.screen_manager.add_widget(screen)
+        self.screen_manager.built_callback = self.on_screen_built
+        self.screen_manager.add_widget(LoginScreen(name='login'))
+        self.screen_manager.register_screen('main', MainScreen)
+        self.screen_manager.register_screen('write', WriteNFCScreen)
+        self.screen_manager.register_screen('read', ReadNFCScreen)
 
         # Настраиваем обработчик Intent
         self.setup_intent_handling()
 
         return self.screen_manager
 
-    def setup_intent_handling(self):
-        """Настройка обработки Intent"""
+    def on_screen_built(self, screen):
+        """Экран создан: регистрация его обработчика Intent"""
+        if hasattr(screen, 'process_nfc_intent'):
+            self.intent_dispatcher.register(screen.name, screen.process_nfc_intent)
 
-        def intent_callback(intent):
-            print(f"Callback Intent получен, текущий экран: {self.screen_manager.current}")
+    def on_nfc_intent(self, intent):
+        """Intent метки (на ПК - от эмулятора nfc_simulator)
 
-            # Передаем Intent текущему экрану
-            current_screen = self.screen_manager.current_screen
-            if current_screen:
-                if hasattr(current_screen, 'process_nfc_intent'):
-                    current_screen.process_nfc_intent(intent)
-                else:
-                    print(f"Экран {current_screen.name} не имеет метода process_nfc_intent")
-            else:
-                print("Нет текущего экрана")
+        Может вызываться не из главного потока: Intent только ставится
+        в очередь, экран получает его в главном потоке.
+        """
+        if not self.intent_dispatcher.submit(intent):
+            print("Очередь Intent переполнена, Intent отброшен")
 
+    def current_intent_target(self) -> Optional[str]:
+        """Экран для Intent или None, пока идет переход между экранами"""
+        if self.screen_manager.transition.is_active:
+            return None
+        return self.screen_manager.current
+
+    def setup_intent_handling(self):
+        """Настройка обработки Intent"""
         if platform == 'android':
             try:
-                setup_intent_handler(intent_callback)
+                setup_intent_handler(self.on_nfc_intent)
                 print("Обработчик Intent настроен")
             except Exception as e:
                 print(f"Ошибка настройки обработчика Intent: {e}")
@@ -938,43 +1357,66 @@ class NFCPasswordManagerApp(App):
     def on_start(self):
         """Вызывается при запуске приложения"""
         print("Приложение запущено")
-
+        self.password_manager.when_loaded(self.on_passwords_loaded)
+        Clock.schedule_once(self.on_first_frame, 0)
+
+    def on_first_frame(self, dt):
+        """Экран PIN показан: фоновая подготовка шифрования и NFC"""
+        elapsed = (time.perf_counter() - STARTUP_TIME) * 1000
+        print(f"Первый кадр через {elapsed:.0f} мс после запуска")
+        tracing.record('first frame', 'startup', STARTUP_TIME)
+        EncryptionManager.warm_up()
+        Clock.schedule_once(self.initialize_nfc, NFC_INIT_DELAY)
+
+    def initialize_nfc(self, dt):
+        """Импорт NFC менеджера и инициализация адаптера вне запуска"""
+        manager = get_nfc_manager()
+        if hasattr(manager, 'initialize_nfc'):
+            manager.initialize_nfc()
+
+    def on_passwords_loaded(self):
+        """Пароли загружены в фоне"""
         # Создаем тестовые данные при первом запуске (для отладки)
         if not self.password_manager.passwords:
             print("Создаю тестовые данные...")
             self.create_sample_data()
+            return
+
+        removed, reclaimed = self.password_manager.deduplicate()
+        if removed:
+            print(f"Удалено дубликатов: {removed}, освобождено ~{reclaimed} байт")
 
     def create_sample_data(self):
         """Создание тестовых данных для демонстрации"""
-        from datetime import datetime
-
-        sample_data = {
-            "example.com": [{
-                "username": "demo_user",
-                "password": "demo123",
-                "created": datetime.now().isoformat()
-            }],
-            "gmail.com": [{
-                "username": "test@gmail.com",
-                "password": "TestPassword123",
-                "created": datetime.now().isoformat()
-            }]
-        }
+        sample_data = [
+            ("example.com", "demo_user", "demo123"),
+            ("gmail.com", "test@gmail.com", "TestPassword123"),
+        ]
 
-        self.password_manager.passwords = sample_data
-        self.password_manager.save_passwords()
+        for service, username, password in sample_data:
+            self.password_manager.add_password(service, username, password)
         print("Тестовые данные созданы")
 
     def on_stop(self):
         """Вызывается при остановке приложения"""
-        if platform == 'android':
+        self.password_manager.drain()
+        if hasattr(nfc_manager, 'debouncer'):
+            print(f"Повторные касания NFC: {nfc_manager.debouncer.stats}")
+        print(f"Кэш считанных меток: {EncryptionManager.read_cache.stats}")
+        print(f"Очередь Intent: {self.intent_dispatcher.metrics()}")
+        if platform == 'android' and nfc_manager is not None:
             nfc_manager.disable_foreground_dispatch()
+        tracing.flush()
         print("Приложение остановлено")
 
     def on_pause(self):
         """При паузе приложения"""
-        if platform == 'android':
+        # Система может завершить приостановленное приложение
+        self.password_manager.drain()
+        EncryptionManager.clear_key_cache()
+        if platform == 'android' and nfc_manager is not None:
             nfc_manager.disable_foreground_dispatch()
+        tracing.flush()
         return True
 
     def on_resume(self):
@@ -982,7 +1424,7 @@ class NFCPasswordManagerApp(App):
         if platform == 'android':
             current_screen = self.screen_manager.current_screen
             if current_screen and current_screen.name in ['write', 'read']:
-                nfc_manager.enable_foreground_dispatch()
+                get_nfc_manager().enable_foreground_dispatch()
 
 
 if __name__ == '__main__':
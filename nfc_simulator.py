@@ -0,0 +1,178 @@
+"""
+NFC Tag Simulator
+Метки NTAG в памяти для проверки записи и чтения без устройства
+
+Память метки моделируется постранично (4 байта), время операций -
+по числу команд READ (4 страницы) и WRITE (1 страница). Метка может
+"пропасть" на любой команде с заданной вероятностью. Чтение и запись
+идут через тот же PageWriter, что и на устройстве.
+"""
+
+import os
+import time
+import random
+import threading
+from typing import Dict, Optional
+
+from android_nfc import AndroidNFCManager, PageWriter, TagLostError, PAGE_SIZE, READ_PAGES
+import payload
+
+# Время операций (сек): подключение, команда READ, команда WRITE
+CONNECT_LATENCY = 0.010
+READ_LATENCY = 0.0015
+WRITE_LATENCY = 0.0045
+
+
+class SimulatedTag:
+    """Метка NTAG: UID и пользовательская память"""
+
+    def __init__(self, tag_type: str = 'NTAG216', uid: Optional[bytes] = None):
+        self.tag_type = tag_type
+        # UID меток NXP - 7 байт, первый байт - код производителя 0x04
+        self.uid = uid or b'\x04' + os.urandom(6)
+        self.memory = bytearray(payload.TAG_CAPACITIES[tag_type])
+        self.present = True
+        self.writable = True
+
+    @property
+    def pages(self) -> int:
+        return len(self.memory) // PAGE_SIZE
+
+    def __repr__(self):
+        return f'SimulatedTag({self.tag_type}, {self.uid.hex()})'
+
+
+class SimulatedIntent:
+    """Intent обнаружения метки"""
+
+    def __init__(self, tag: Optional[SimulatedTag]):
+        self.tag = tag
+
+
+class SimulatedTagBackend:
+    """Операции с метками в памяти с моделью задержек и потерь
+
+    time_scale - множитель реальных задержек (0 - без ожидания),
+    loss_rate - вероятность потери метки на каждой команде.
+    """
+
+    def __init__(self, time_scale: float = 1.0, loss_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.time_scale = time_scale
+        self.loss_rate = loss_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {
+            'connects': 0,
+            'pages_read': 0,
+            'pages_written': 0,
+            'pages_skipped': 0,
+            'tags_lost': 0,
+            'busy_time': 0.0,
+        }
+
+    @staticmethod
+    def tag_from_intent(intent) -> Optional[SimulatedTag]:
+        return getattr(intent, 'tag', None)
+
+    @staticmethod
+    def uid(tag: SimulatedTag) -> bytes:
+        return tag.uid
+
+    def command(self, tag: SimulatedTag, latency: float):
+        """Одна команда к метке: задержка и возможная потеря"""
+        with self.lock:
+            self.stats['busy_time'] += latency
+        if self.time_scale:
+            time.sleep(latency * self.time_scale)
+        if not tag.present or self.random.random() < self.loss_rate:
+            with self.lock:
+                self.stats['tags_lost'] += 1
+            raise TagLostError(f"Метка {tag.uid.hex()} потеряна")
+
+    def connect(self, tag: SimulatedTag):
+        with self.lock:
+            self.stats['connects'] += 1
+        self.command(tag, CONNECT_LATENCY)
+
+    def read_block(self, tag: SimulatedTag, page: int) -> bytes:
+        """Команда READ: 4 страницы начиная с page (с переходом на начало)"""
+        self.command(tag, READ_LATENCY)
+        with self.lock:
+            self.stats['pages_read'] += READ_PAGES
+        memory = bytes(tag.memory)
+        start = page * PAGE_SIZE
+        block = memory[start:start + READ_PAGES * PAGE_SIZE]
+        return block + memory[:READ_PAGES * PAGE_SIZE - len(block)]
+
+    def write_page(self, tag: SimulatedTag, page: int, data: bytes):
+        """Команда WRITE: одна страница"""
+        self.command(tag, WRITE_LATENCY)
+        if not tag.writable:
+            raise IOError("Метка защищена от записи")
+        tag.memory[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] = data.ljust(PAGE_SIZE, b'\0')
+        with self.lock:
+            self.stats['pages_written'] += 1
+
+    def page_writer(self, tag: SimulatedTag) -> PageWriter:
+        return PageWriter(lambda page: self.read_block(tag, page),
+                          lambda page, data: self.write_page(tag, page, data),
+                          len(tag.memory))
+
+    def read(self, tag: SimulatedTag) -> Optional[bytes]:
+        self.connect(tag)
+        return self.page_writer(tag).read_ndef()
+
+    def write(self, tag: SimulatedTag, data: bytes) -> bool:
+        """Запись изменившихся страниц с проверкой"""
+        self.connect(tag)
+        writer = self.page_writer(tag)
+        success = writer.write_ndef(data)
+        with self.lock:
+            self.stats['pages_skipped'] += writer.pages_skipped
+        return success
+
+    def abort(self, tag: SimulatedTag):
+        pass
+
+
+class SimulatedNFCManager(AndroidNFCManager):
+    """nfc_manager с метками в памяти для запуска на ПК"""
+
+    def __init__(self, time_scale: float = 1.0, loss_rate: float = 0.0,
+                 seed: Optional[int] = None, schedule=None):
+        super().__init__(backend=SimulatedTagBackend(time_scale, loss_rate, seed),
+                         schedule=schedule)
+        self.tags: Dict[bytes, SimulatedTag] = {}
+
+    def new_tag(self, tag_type: str = 'NTAG216') -> SimulatedTag:
+        """Новая пустая метка"""
+        tag = SimulatedTag(tag_type, b'\x04' + self.backend.random.randbytes(6))
+        self.tags[tag.uid] = tag
+        return tag
+
+    @staticmethod
+    def tap(tag: SimulatedTag) -> SimulatedIntent:
+        """Intent, как при поднесении метки к телефону"""
+        tag.present = True
+        return SimulatedIntent(tag)
+
+    @staticmethod
+    def remove(tag: SimulatedTag):
+        """Метка убрана: текущая операция завершится потерей метки"""
+        tag.present = False
+
+    def is_nfc_available(self):
+        return True
+
+    def enable_foreground_dispatch(self):
+        return True
+
+    def disable_foreground_dispatch(self):
+        self.worker.cancel()
+
+    def show_toast(self, message):
+        print(f"Toast: {message}")
+
+    def open_nfc_settings(self):
+        print("Открыть настройки NFC")
@@ -0,0 +1,412 @@
+"""
+Tag Payload Format
+Компактный бинарный формат данных на NFC метке
+
+Формат (версия 1):
+    1 байт   сигнатура 0xA7
+    1 байт   версия (старшие 4 бита) и флаги (младшие 4 бита)
+    1 байт   номер словаря сжатия (только с флагом FLAG_PRESET_DICT)
+    varint   число итераций KDF
+    16 байт  соль
+    12 байт  nonce AES-GCM
+    ...      шифртекст полей (AES-GCM, заголовок - связанные данные)
+    16 байт  тег аутентификации
+
+Поля открытого текста: varint номер поля, varint длина, UTF-8 байты.
+Неизвестные номера полей пропускаются.
+
+С флагом FLAG_CONTAINER открытый текст - несколько учетных записей,
+каждая с префиксом varint длины.
+"""
+
+import base64
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+PAYLOAD_MAGIC = 0xA7
+PAYLOAD_VERSION = 1
+FLAG_COMPRESSED = 0x01
+FLAG_PRESET_DICT = 0x02
+FLAG_CONTAINER = 0x04
+
+SALT_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# Допустимое число итераций PBKDF2 в заголовке (как KDF_MIN_ITERATIONS
+# и KDF_MAX_ITERATIONS в vault); иное значение - поврежденные данные
+MIN_ITERATIONS = 10000
+MAX_ITERATIONS = 10000000
+# Наибольший заголовок: сигнатура, флаги, словарь, varint итераций
+MAX_HEADER_SIZE = 3 + 5 + SALT_SIZE + NONCE_SIZE
+
+# Пользовательская память меток NTAG (байт)
+TAG_CAPACITIES = {
+    'NTAG213': 144,
+    'NTAG215': 504,
+    'NTAG216': 888,
+}
+# Длина MIME типа NDEF записи (см. android_nfc.MIME_TYPE)
+NDEF_MIME_TYPE_SIZE = len('application/org.nfc.passwordmanager')
+# Подбор набора записей динамическим программированием,
+# пока число записей * емкость не превышает этого значения
+PLAN_DP_LIMIT = 200000
+
+FIELD_IDS = {
+    'service': 1,
+    'username': 2,
+    'password': 3,
+}
+FIELD_NAMES = {field_id: name for name, field_id in FIELD_IDS.items()}
+
+# Словари для сжатия коротких строк (zlib zdict). Составлены из частых
+# сервисов, доменов почты и шаблонов логинов; самые частые фрагменты
+# стоят в конце, где ссылки на них короче. Выпущенный словарь
+# не меняется - для нового набора добавляется следующий номер.
+PRESET_DICTIONARIES = {
+    1: ''.join([
+        'qwerty123456password1admin0987654321',
+        'user_login_test.demo-info',
+        'ok.rumail.ruvk.comavito.ruozon.rusberbank.rugosuslugi.ruwildberries.ru',
+        'tinkoff.rukinopoisk.rudiscord.comsteamcommunity.comspotify.comnetflix.com',
+        'amazon.comapple.comicloud.commicrosoft.comlinkedin.comreddit.com',
+        'twitter.comfacebook.cominstagram.comtelegram.orgwhatsapp.comyoutube.com',
+        'github.comgitlab.comaccounts.google.comlogin.live.comoutlook.com',
+        '@icloud.com@hotmail.com@outlook.com@rambler.ru@bk.ru@list.ru@inbox.ru',
+        '@yahoo.com@ya.ru@yandex.ru@mail.ruyandex.rumail.google.com',
+        'https://www.http://https://gmail.com@gmail.com',
+    ]).encode('utf-8'),
+}
+CURRENT_DICTIONARY = 1
+
+# Заголовок старого формата: сигнатура, итерации, соль + iv
+LEGACY_HEADER_SIZE = 3 + 4 + 16 + 16
+
+
+def encode_varint(value: int) -> bytes:
+    """Беззнаковое целое в формате varint (7 бит на байт)"""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Чтение varint: (значение, позиция после него)"""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("Оборванный varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_fields(fields: Dict[str, str]) -> bytes:
+    """Кодирование полей учетной записи"""
+    out = bytearray()
+    for name, value in fields.items():
+        raw = value.encode('utf-8')
+        out += encode_varint(FIELD_IDS[name])
+        out += encode_varint(len(raw))
+        out += raw
+    return bytes(out)
+
+
+def decode_fields(data: bytes) -> Dict[str, str]:
+    """Разбор полей учетной записи"""
+    fields = {}
+    pos = 0
+    while pos < len(data):
+        field_id, pos = decode_varint(data, pos)
+        length, pos = decode_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError("Поле выходит за границы данных")
+        name = FIELD_NAMES.get(field_id)
+        if name is not None:
+            fields[name] = data[pos:pos + length].decode('utf-8')
+        pos += length
+    return fields
+
+
+def encode_container(credentials: List[Dict[str, str]]) -> bytes:
+    """Несколько учетных записей в одном открытом тексте"""
+    out = bytearray()
+    for fields in credentials:
+        raw = encode_fields(fields)
+        out += encode_varint(len(raw))
+        out += raw
+    return bytes(out)
+
+
+def decode_container(data: bytes) -> List[Dict[str, str]]:
+    """Обратное к encode_container"""
+    credentials = []
+    pos = 0
+    while pos < len(data):
+        length, pos = decode_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError("Запись выходит за границы контейнера")
+        credentials.append(decode_fields(data[pos:pos + length]))
+        pos += length
+    return credentials
+
+
+def deflate(data: bytes, zdict: Optional[bytes] = None) -> bytes:
+    """Raw deflate, при наличии - с предустановленным словарем"""
+    if zdict:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(data: bytes, use_dictionary: bool = True) -> Tuple[bytes, int, int]:
+    """Самый короткий вариант: (данные, флаги, номер словаря)
+
+    Пробуются сжатие со словарем, без словаря и отсутствие сжатия.
+    """
+    best = (data, 0, 0)
+    packed = deflate(data)
+    if len(packed) < len(best[0]):
+        best = (packed, FLAG_COMPRESSED, 0)
+    if use_dictionary:
+        packed = deflate(data, PRESET_DICTIONARIES[CURRENT_DICTIONARY])
+        # Номер словаря занимает в заголовке еще один байт
+        if len(packed) + 1 < len(best[0]):
+            best = (packed, FLAG_COMPRESSED | FLAG_PRESET_DICT, CURRENT_DICTIONARY)
+    return best
+
+
+def decompress(data: bytes, flags: int, dictionary: int = 0) -> bytes:
+    """Обратное к compress"""
+    if not flags & FLAG_COMPRESSED:
+        return data
+    if flags & FLAG_PRESET_DICT:
+        zdict = PRESET_DICTIONARIES.get(dictionary)
+        if zdict is None:
+            raise ValueError(f"Неизвестный словарь сжатия: {dictionary}")
+        decompressor = zlib.decompressobj(-15, zdict=zdict)
+        return decompressor.decompress(data) + decompressor.flush()
+    return zlib.decompress(data, -15)
+
+
+def pack_header(flags: int, iterations: int, salt: bytes, nonce: bytes,
+                dictionary: int = 0) -> bytes:
+    """Заголовок бинарного формата"""
+    header = bytes((PAYLOAD_MAGIC, PAYLOAD_VERSION << 4 | flags))
+    if flags & FLAG_PRESET_DICT:
+        header += bytes((dictionary,))
+    return header + encode_varint(iterations) + salt + nonce
+
+
+def unpack_header(data: bytes) -> Tuple[int, int, int, bytes, bytes, int]:
+    """Разбор заголовка: (флаги, словарь, итерации, соль, nonce, начало шифртекста)"""
+    if not is_binary_payload(data):
+        raise ValueError("Не бинарный формат")
+    version, flags = data[1] >> 4, data[1] & 0x0F
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата: {version}")
+
+    pos = 2
+    dictionary = 0
+    if flags & FLAG_PRESET_DICT:
+        if len(data) <= pos:
+            raise ValueError("Данные короче заголовка")
+        dictionary = data[pos]
+        pos += 1
+
+    iterations, pos = decode_varint(data, pos)
+    if not MIN_ITERATIONS <= iterations <= MAX_ITERATIONS:
+        raise ValueError(f"Недопустимое число итераций: {iterations}")
+    salt = data[pos:pos + SALT_SIZE]
+    pos += SALT_SIZE
+    nonce = data[pos:pos + NONCE_SIZE]
+    pos += NONCE_SIZE
+    if len(data) < pos + TAG_SIZE:
+        raise ValueError("Данные короче заголовка")
+    return flags, dictionary, iterations, salt, nonce, pos
+
+
+def is_binary_payload(data: bytes) -> bool:
+    return len(data) >= 2 and data[0] == PAYLOAD_MAGIC
+
+
+def payload_to_text(data: Union[bytes, str]) -> str:
+    """Данные метки в виде текста для поля ввода
+
+    Бинарный формат показывается в base64, старый уже является текстом.
+    """
+    if isinstance(data, str):
+        return data
+    if is_binary_payload(data):
+        return base64.b64encode(data).decode()
+    return data.decode('ascii', errors='replace')
+
+
+def text_to_payload(text: str) -> Union[bytes, str]:
+    """Обратное к payload_to_text: bytes для бинарного формата, иначе текст"""
+    try:
+        data = base64.b64decode(text, validate=True)
+    except ValueError:
+        return text
+    return data if is_binary_payload(data) else text
+
+
+def legacy_payload_size(plaintext_size: int) -> int:
+    """Размер того же содержимого в старом формате (base64 от AES-CBC)"""
+    padded = (plaintext_size // 16 + 1) * 16
+    raw = LEGACY_HEADER_SIZE + padded
+    return (raw + 2) // 3 * 4
+
+
+def ndef_size(payload_size: int) -> int:
+    """Объем памяти метки под NDEF сообщение с одной MIME записью"""
+    # Заголовок записи, длина типа, длина данных (1 байт для коротких записей)
+    record = 2 + (1 if payload_size < 256 else 4) + NDEF_MIME_TYPE_SIZE + payload_size
+    # TLV сообщения (длина 1 или 3 байта) и завершающий TLV
+    return (2 if record < 255 else 4) + record + 1
+
+
+def encode_ndef(data: bytes) -> bytes:
+    """NDEF сообщение с одной MIME записью в TLV, как оно лежит в памяти метки"""
+    mime = b'application/org.nfc.passwordmanager'
+    if len(data) < 256:
+        # MB | ME | SR, TNF = 2 (MIME)
+        record = bytes((0xD2, len(mime), len(data))) + mime + data
+    else:
+        record = bytes((0xC2, len(mime))) + len(data).to_bytes(4, 'big') + mime + data
+    if len(record) < 255:
+        tlv = bytes((0x03, len(record)))
+    else:
+        tlv = bytes((0x03, 0xFF)) + len(record).to_bytes(2, 'big')
+    return tlv + record + b'\xfe'
+
+
+def decode_ndef(memory: bytes) -> Optional[bytes]:
+    """Данные MIME записи из памяти метки (обратное к encode_ndef)"""
+    if len(memory) < 2 or memory[0] != 0x03:
+        return None
+    if memory[1] == 0xFF:
+        length = int.from_bytes(memory[2:4], 'big')
+        pos = 4
+    else:
+        length = memory[1]
+        pos = 2
+    record = memory[pos:pos + length]
+    if len(record) != length or len(record) < 3:
+        return None
+
+    header, type_length = record[0], record[1]
+    if header & 0x10:
+        data_length, pos = record[2], 3
+    else:
+        data_length, pos = int.from_bytes(record[2:6], 'big'), 6
+    pos += type_length
+    data = record[pos:pos + data_length]
+    return data if len(data) == data_length else None
+
+
+def tag_payload_capacity(tag_capacity: int) -> int:
+    """Наибольший размер данных, помещающихся на метку"""
+    size = tag_capacity
+    while size > 0 and ndef_size(size) > tag_capacity:
+        size -= 1
+    return size
+
+
+def sealed_size(plaintext_size: int) -> int:
+    """Наибольший размер зашифрованных данных для открытого текста"""
+    return MAX_HEADER_SIZE + plaintext_size + TAG_SIZE
+
+
+def plan_container(sizes: Sequence[int], capacity: int,
+                   values: Optional[Sequence[int]] = None) -> List[int]:
+    """Выбор записей для одной метки (задача о рюкзаке)
+
+    sizes - размеры закодированных записей, capacity - байт на метке,
+    values - ценность записей (по умолчанию важно только их число).
+    Возвращает индексы выбранных записей в исходном порядке.
+    Размеры берутся без сжатия, поэтому выбранный набор всегда помещается.
+    """
+    budget = tag_payload_capacity(capacity) - sealed_size(0)
+    costs = [size + len(encode_varint(size)) for size in sizes]
+    candidates = [i for i, cost in enumerate(costs) if cost <= budget]
+    if budget <= 0 or not candidates:
+        return []
+
+    if values is None:
+        # При равной ценности оптимален выбор самых коротких записей
+        chosen = []
+        for i in sorted(candidates, key=lambda i: costs[i]):
+            if costs[i] > budget:
+                break
+            chosen.append(i)
+            budget -= costs[i]
+        return sorted(chosen)
+
+    if len(candidates) * budget > PLAN_DP_LIMIT:
+        # Слишком много записей для точного решения - жадно по удельной ценности
+        chosen = []
+        for i in sorted(candidates, key=lambda i: values[i] / costs[i], reverse=True):
+            if costs[i] <= budget:
+                chosen.append(i)
+                budget -= costs[i]
+        return sorted(chosen)
+
+    # best[c] - наибольшая ценность при занятом объеме не больше c
+    best = [0] * (budget + 1)
+    taken = []
+    for i in candidates:
+        cost, value = costs[i], values[i]
+        row = bytearray(budget + 1)
+        for c in range(budget, cost - 1, -1):
+            if best[c - cost] + value > best[c]:
+                best[c] = best[c - cost] + value
+                row[c] = 1
+        taken.append(row)
+
+    chosen = []
+    c = budget
+    for i, row in zip(reversed(candidates), reversed(taken)):
+        if row[c]:
+            chosen.append(i)
+            c -= costs[i]
+    return sorted(chosen)
+
+
+def pack_credentials(credentials: Sequence[Dict[str, str]], capacity: int,
+                     values: Optional[Sequence[int]] = None) -> List[int]:
+    """Индексы записей для контейнера на метке емкостью capacity
+
+    К плану без учета сжатия добавляются записи, пока сжатый
+    контейнер еще помещается на метку.
+    """
+    encoded = [encode_fields(fields) for fields in credentials]
+    chosen = plan_container([len(raw) for raw in encoded], capacity, values)
+    if not chosen:
+        return chosen
+
+    budget = tag_payload_capacity(capacity) - sealed_size(0)
+    chosen_set = set(chosen)
+    rest = [i for i in range(len(encoded)) if i not in chosen_set]
+    if values is None:
+        rest.sort(key=lambda i: len(encoded[i]))
+    else:
+        rest.sort(key=lambda i: values[i], reverse=True)
+
+    for i in rest:
+        trial = sorted(chosen + [i])
+        plaintext = encode_container([credentials[j] for j in trial])
+        if len(compress(plaintext)[0]) > budget:
+            break
+        chosen = trial
+    return chosen
@@ -0,0 +1,154 @@
+"""
+Search Index
+Поиск сервисов по префиксу и нечеткий поиск по триграммам
+"""
+
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, List, Set
+
+from storage import username_key
+
+# Сколько вхождений триграмм просматривается за один запрос:
+# очень частые триграммы (".co", "com") почти ничего не дают для ранжирования
+FUZZY_BUDGET = 20000
+# Минимальная похожесть (коэффициент Дайса) для нечеткого совпадения
+FUZZY_THRESHOLD = 0.3
+
+
+def trigrams(term: str) -> Set[str]:
+    """Триграммы терма с отступами по краям"""
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Индекс термов (сервисы и логины) -> сервисы
+
+    Отсортированный список термов дает поиск по префиксу через bisect,
+    триграммы - нечеткий поиск. Индекс обновляется по одной записи.
+    """
+
+    def __init__(self):
+        self.terms = []
+        self.term_services: Dict[str, Set[str]] = {}
+        self.trigram_terms: Dict[str, Set[str]] = {}
+
+    def add(self, term: str, service: str):
+        """Добавление терма, указывающего на сервис"""
+        term = term.casefold()
+        if not term:
+            return
+
+        services = self.term_services.get(term)
+        if services is None:
+            services = self.term_services[term] = set()
+            insort(self.terms, term)
+            for gram in trigrams(term):
+                self.trigram_terms.setdefault(gram, set()).add(term)
+        services.add(service)
+
+    def add_entry(self, service: str, entry: Dict):
+        """Индексация сервиса и логина записи"""
+        self.add(service, service)
+        self.add(entry.get('username', ''), service)
+
+    def build(self, entries):
+        """Построение индекса с нуля по парам (сервис, запись)"""
+        for service, entry in entries:
+            for term in (service, entry.get('username', '')):
+                term = term.casefold()
+                if term:
+                    self.term_services.setdefault(term, set()).add(service)
+
+        # Одна сортировка вместо вставки каждого терма
+        self.terms = sorted(self.term_services)
+        for term in self.terms:
+            for gram in trigrams(term):
+                self.trigram_terms.setdefault(gram, set()).add(term)
+
+    def prefix(self, query: str, limit: int = 50) -> List[str]:
+        """Сервисы, у которых сервис или логин начинается с query"""
+        query = query.casefold()
+        results = []
+        seen = set()
+        position = bisect_left(self.terms, query)
+        while position < len(self.terms) and len(results) < limit:
+            term = self.terms[position]
+            if not term.startswith(query):
+                break
+            for service in sorted(self.term_services[term]):
+                if service not in seen:
+                    seen.add(service)
+                    results.append(service)
+            position += 1
+        return results[:limit]
+
+    def fuzzy(self, query: str, limit: int = 50) -> List[str]:
+        """Сервисы с похожим сервисом или логином"""
+        query = query.casefold()
+        query_grams = trigrams(query)
+
+        # Сначала редкие триграммы; частые пропускаются, когда бюджет исчерпан
+        grams = sorted(
+            (gram for gram in query_grams if gram in self.trigram_terms),
+            key=lambda gram: len(self.trigram_terms[gram])
+        )
+        counts = {}
+        budget = FUZZY_BUDGET
+        for gram in grams:
+            postings = self.trigram_terms[gram]
+            if len(postings) > budget:
+                break
+            for term in postings:
+                counts[term] = counts.get(term, 0) + 1
+            budget -= len(postings)
+
+        scored = []
+        for term, count in counts.items():
+            score = 2 * count / (len(query_grams) + len(term) + 1)
+            if score >= FUZZY_THRESHOLD:
+                scored.append((score, term))
+
+        results = []
+        seen = set()
+        for score, term in heapq.nlargest(limit, scored):
+            for service in sorted(self.term_services[term]):
+                if service not in seen:
+                    seen.add(service)
+                    results.append(service)
+        return results[:limit]
+
+    def search(self, query: str, limit: int = 50) -> List[str]:
+        """Совпадения по префиксу, затем нечеткие"""
+        results = self.prefix(query, limit)
+        if len(results) < limit:
+            seen = set(results)
+            for service in self.fuzzy(query, limit):
+                if service not in seen:
+                    results.append(service)
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+class UsernameIndex:
+    """Обратный индекс: логин -> {сервис: id записей}"""
+
+    def __init__(self):
+        self.usernames: Dict[str, Dict[str, Set[str]]] = {}
+
+    def add(self, service: str, entry: Dict):
+        """Добавление записи в индекс"""
+        services = self.usernames.setdefault(username_key(entry.get('username', '')), {})
+        services.setdefault(service, set()).add(entry.get('id'))
+
+    def build(self, entries):
+        """Построение индекса с нуля по парам (сервис, запись)"""
+        self.usernames = {}
+        for service, entry in entries:
+            self.add(service, entry)
+
+    def services_for(self, username: str) -> Dict[str, Set[str]]:
+        """Сервисы и id записей с этим логином"""
+        return self.usernames.get(username_key(username), {})
@@ -1,15 +1,173 @@
 """
 Service for Android Intent handling
-Simplified version for GitHub Actions
+Intent меток доставляются экранам через очередь IntentDispatcher
 """
 
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+
 from kivy.utils import platform
 
+# Очередь Intent: размер, сколько обрабатывать за кадр,
+# сколько секунд Intent может ждать экран (например, конца перехода)
+INTENT_QUEUE_SIZE = 8
+INTENT_BATCH = 4
+INTENT_MAX_AGE = 5.0
+# При переполнении: 'oldest' - вытеснять самый старый Intent, 'newest' - отбрасывать новый
+INTENT_DROP_POLICY = 'oldest'
+
+
+class IntentDispatcher:
+    """Доставка Intent экранам
+
+    Экраны регистрируют обработчики в таблице по имени экрана. Intent
+    кладутся в ограниченную очередь (из любого потока), очередь
+    разбирается в главном потоке через schedule (Clock.schedule_once).
+    Пока target() возвращает None (идет переход между экранами),
+    Intent ждут в очереди.
+    """
+
+    def __init__(self, target: Callable[[], Optional[str]], schedule=None,
+                 maxsize: int = INTENT_QUEUE_SIZE, drop_policy: str = INTENT_DROP_POLICY,
+                 clock=time.monotonic):
+        self.target = target
+        self.schedule = schedule
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.clock = clock
+        self.handlers: Dict[str, Callable] = {}
+        # (время поступления, Intent)
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.drain_scheduled = False
+        self.stats = {
+            'received': 0,
+            'dispatched': 0,
+            'dropped': 0,
+            'expired': 0,
+            'unhandled': 0,
+            'max_depth': 0,
+        }
+        # Имя экрана -> [число вызовов, суммарное время, наибольшее время]
+        self.latency: Dict[str, list] = {}
+
+    def register(self, name: str, handler: Callable):
+        """Обработчик Intent для экрана name"""
+        self.handlers[name] = handler
+
+    def unregister(self, name: str):
+        self.handlers.pop(name, None)
+
+    def submit(self, intent) -> bool:
+        """Постановка Intent в очередь; False, если он отброшен"""
+        with self.lock:
+            self.stats['received'] += 1
+            accepted = True
+            if len(self.queue) >= self.maxsize:
+                self.stats['dropped'] += 1
+                if self.drop_policy == 'newest':
+                    accepted = False
+                else:
+                    self.queue.popleft()
+            if accepted:
+                self.queue.append((self.clock(), intent))
+                self.stats['max_depth'] = max(self.stats['max_depth'], len(self.queue))
+            need_drain = not self.drain_scheduled
+            self.drain_scheduled = True
+
+        if need_drain:
+            self.request_drain()
+        return accepted
+
+    def request_drain(self, delay: float = 0):
+        if self.schedule:
+            self.schedule(self.drain, delay)
+        else:
+            self.drain()
+
+    def drain(self, dt=None):
+        """Обработка до INTENT_BATCH Intent (в главном потоке)"""
+        waiting = False
+        for _ in range(INTENT_BATCH):
+            with self.lock:
+                if not self.queue:
+                    self.drain_scheduled = False
+                    return
+                received, intent = self.queue[0]
+                if self.clock() - received > INTENT_MAX_AGE:
+                    self.queue.popleft()
+                    self.stats['expired'] += 1
+                    continue
+
+                name = self.target()
+                if name is None:
+                    # Экран еще не готов - повтор в следующем кадре
+                    waiting = True
+                    break
+                self.queue.popleft()
+
+            self.dispatch(name, intent)
+
+        with self.lock:
+            # Без планировщика Intent ждут следующего явного drain()
+            if not self.queue or (waiting and not self.schedule):
+                self.drain_scheduled = False
+                return
+        self.request_drain()
+
+    def dispatch(self, name: str, intent):
+        handler = self.handlers.get(name)
+        if handler is None:
+            self.stats['unhandled'] += 1
+            print(f"Экран {name} не обрабатывает Intent")
+            return
+
+        started = time.perf_counter()
+        try:
+            handler(intent)
+        except Exception as e:
+            print(f"Ошибка обработки Intent на экране {name}: {e}")
+        elapsed = time.perf_counter() - started
+
+        self.stats['dispatched'] += 1
+        latency = self.latency.setdefault(name, [0, 0.0, 0.0])
+        latency[0] += 1
+        latency[1] += elapsed
+        latency[2] = max(latency[2], elapsed)
+
+    def replay(self, intents: Iterable, interval: float = 0):
+        """Подача записанных или синтетических Intent с интервалом interval (сек)"""
+        for i, intent in enumerate(intents):
+            if interval and self.schedule:
+                self.schedule(lambda dt, intent=intent: self.submit(intent), i * interval)
+            else:
+                self.submit(intent)
+
+    def metrics(self) -> Dict:
+        """Глубина очереди, счетчики и время обработчиков (мс)"""
+        with self.lock:
+            result = dict(self.stats, depth=len(self.queue))
+        result['handlers'] = {
+            name: {
+                'count': count,
+                'avg_ms': round(total / count * 1000, 3),
+                'max_ms': round(worst * 1000, 3),
+            }
+            for name, (count, total, worst) in self.latency.items()
+        }
+        return result
+
+
 def setup_intent_handler(callback):
-    print(f"Intent handler setup called with callback: {callback}")
-    # In GitHub Actions this won't execute
-    # Real implementation will be on device
-    pass
+    """Подписка на новые Intent активности (callback вызывается в потоке Java)"""
+    if platform != 'android':
+        print(f"Intent handler setup called with callback: {callback}")
+        return
+    from android import activity
+    activity.bind(on_new_intent=callback)
+
 
 if platform == 'android':
     print("Running on Android")
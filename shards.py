@@ -0,0 +1,232 @@
+"""
+Vault Shards
+Резервная копия хранилища на нескольких NFC метках
+
+Зашифрованная копия делится на пронумерованные части, по одной на метку.
+Каждая часть несет манифест всей копии, поэтому собирать их можно
+в любом порядке. Части четности (XOR по группам) позволяют восстановить
+одну потерянную часть в каждой группе.
+
+Заголовок части:
+    1 байт   сигнатура 0xA8
+    1 байт   версия
+    8 байт   id копии
+    2 байта  номер части (части четности идут после частей данных)
+    2 байта  число частей данных
+    1 байт   число частей четности
+    4 байта  размер копии
+    16 байт  blake2b хэш копии
+    4 байта  crc32 данных части
+"""
+
+import os
+import json
+import zlib
+import base64
+import hashlib
+import struct
+from typing import Dict, List, Optional
+
+from storage import write_file_atomic
+
+SHARD_MAGIC = 0xA8
+SHARD_VERSION = 1
+SHARD_HEADER = struct.Struct('<BB8sHHBI16sI')
+BACKUP_ID_SIZE = 8
+DIGEST_SIZE = 16
+# Наибольшее число частей четности
+MAX_PARITY = 8
+
+
+def blob_digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=DIGEST_SIZE).digest()
+
+
+def xor_bytes(a: bytes, b: bytes) -> bytes:
+    """Побайтовый XOR строк одинаковой длины"""
+    size = len(a)
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(size, 'little')
+
+
+def is_shard(data: bytes) -> bool:
+    return isinstance(data, bytes) and len(data) >= SHARD_HEADER.size and data[0] == SHARD_MAGIC
+
+
+def split_blob(blob: bytes, body_size: int, parity: int = 0,
+               backup_id: Optional[bytes] = None) -> List[bytes]:
+    """Деление копии на части с данными не длиннее body_size
+
+    Часть четности j - XOR частей данных с номерами i % parity == j.
+    """
+    if body_size <= 0:
+        raise ValueError("Метка слишком мала для части копии")
+    parity = max(0, min(parity, MAX_PARITY))
+    backup_id = backup_id or os.urandom(BACKUP_ID_SIZE)
+    digest = blob_digest(blob)
+
+    bodies = [blob[i:i + body_size] for i in range(0, len(blob), body_size)] or [b'']
+    count = len(bodies)
+    if count > 0xFFFF:
+        raise ValueError("Слишком много частей")
+    parity = min(parity, count)
+
+    parity_bodies = []
+    for group in range(parity):
+        body = bytes(body_size)
+        for i in range(group, count, parity):
+            body = xor_bytes(body, bodies[i].ljust(body_size, b'\0'))
+        parity_bodies.append(body)
+
+    shards = []
+    for index, body in enumerate(bodies + parity_bodies):
+        header = SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, backup_id, index, count,
+                                   parity, len(blob), digest, zlib.crc32(body))
+        shards.append(header + body)
+    return shards
+
+
+def parse_shard(data: bytes) -> Dict:
+    """Разбор части копии, ValueError при повреждении"""
+    if not is_shard(data):
+        raise ValueError("Не часть резервной копии")
+    (magic, version, backup_id, index, count, parity,
+     size, digest, checksum) = SHARD_HEADER.unpack_from(data)
+    if version != SHARD_VERSION:
+        raise ValueError(f"Неподдерживаемая версия части: {version}")
+    body = data[SHARD_HEADER.size:]
+    if zlib.crc32(body) != checksum:
+        raise ValueError(f"Неверная контрольная сумма части {index + 1}")
+    if index >= count + parity:
+        raise ValueError(f"Неверный номер части: {index + 1}")
+    return {
+        'backup_id': backup_id,
+        'index': index,
+        'count': count,
+        'parity': parity,
+        'size': size,
+        'digest': digest,
+        'body': body,
+    }
+
+
+class ShardCollector:
+    """Сбор частей копий между сеансами
+
+    Собранные части сохраняются в файл (они уже зашифрованы),
+    поэтому чтение меток можно продолжить после перезапуска.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        # id копии (hex) -> {'manifest': {...}, 'shards': {номер: данные}}
+        self.backups: Dict[str, Dict] = {}
+        if path:
+            self.load()
+
+    def load(self):
+        """Чтение незавершенных копий"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            for backup_id, backup in saved.items():
+                self.backups[backup_id] = {
+                    'manifest': backup['manifest'],
+                    'shards': {int(index): base64.b64decode(body)
+                               for index, body in backup['shards'].items()},
+                }
+        except (json.JSONDecodeError, KeyError, ValueError, IOError) as e:
+            print(f"Ошибка чтения частей копии: {e}")
+            self.backups = {}
+
+    def save(self):
+        if not self.path:
+            return
+        saved = {
+            backup_id: {
+                'manifest': backup['manifest'],
+                'shards': {str(index): base64.b64encode(body).decode()
+                           for index, body in backup['shards'].items()},
+            }
+            for backup_id, backup in self.backups.items()
+        }
+        try:
+            write_file_atomic(self.path, json.dumps(saved).encode('utf-8'))
+        except IOError as e:
+            print(f"Ошибка сохранения частей копии: {e}")
+
+    def add(self, data: bytes) -> str:
+        """Добавление части, возвращает id копии (hex)"""
+        shard = parse_shard(data)
+        backup_id = shard['backup_id'].hex()
+        manifest = {
+            'count': shard['count'],
+            'parity': shard['parity'],
+            'size': shard['size'],
+            'digest': shard['digest'].hex(),
+        }
+        backup = self.backups.setdefault(backup_id, {'manifest': manifest, 'shards': {}})
+        if backup['manifest'] != manifest:
+            raise ValueError("Манифест части не совпадает с остальными частями копии")
+
+        if shard['index'] not in backup['shards']:
+            backup['shards'][shard['index']] = shard['body']
+            self.save()
+        return backup_id
+
+    def missing(self, backup_id: str) -> List[int]:
+        """Номера недостающих частей данных, которые нельзя восстановить"""
+        backup = self.backups[backup_id]
+        manifest, shards = backup['manifest'], backup['shards']
+        count, parity = manifest['count'], manifest['parity']
+
+        missing = []
+        for index in range(count):
+            if index in shards:
+                continue
+            group = index % parity if parity else None
+            if group is not None and count + group in shards:
+                lost_in_group = [i for i in range(group, count, parity) if i not in shards]
+                if len(lost_in_group) == 1:
+                    continue
+            missing.append(index)
+        return missing
+
+    def progress(self, backup_id: str):
+        """(частей собрано, частей данных нужно)"""
+        backup = self.backups[backup_id]
+        return len(backup['shards']), backup['manifest']['count']
+
+    def is_complete(self, backup_id: str) -> bool:
+        return not self.missing(backup_id)
+
+    def assemble(self, backup_id: str) -> bytes:
+        """Сборка копии с восстановлением по четности и проверкой хэша"""
+        backup = self.backups[backup_id]
+        manifest, shards = backup['manifest'], backup['shards']
+        count, parity = manifest['count'], manifest['parity']
+        if self.missing(backup_id):
+            raise ValueError("Собраны не все части копии")
+
+        body_size = max(len(body) for body in shards.values())
+        bodies = []
+        for index in range(count):
+            body = shards.get(index)
+            if body is None:
+                group = index % parity
+                body = shards[count + group]
+                for i in range(group, count, parity):
+                    if i != index:
+                        body = xor_bytes(body, shards[i].ljust(body_size, b'\0'))
+            bodies.append(body)
+
+        blob = b''.join(bodies)[:manifest['size']]
+        if blob_digest(blob).hex() != manifest['digest']:
+            raise ValueError("Хэш собранной копии не совпадает")
+        return blob
+
+    def discard(self, backup_id: str):
+        """Удаление собранной копии"""
+        if self.backups.pop(backup_id, None) is not None:
+            self.save()
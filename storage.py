@@ -0,0 +1,717 @@
+"""
+Vault Storage
+Хранение паролей: JSON снимок и журнал изменений
+"""
+
+import os
+import json
+import zlib
+import queue
+import marshal
+import hashlib
+import sqlite3
+import time
+import struct
+import threading
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Размер журнала, после которого он сворачивается в снимок
+JOURNAL_COMPACT_SIZE = 256 * 1024
+# Максимум операций в очереди потока ввода-вывода
+PERSIST_QUEUE_SIZE = 16
+
+# Заголовок бинарного кэша снимка: сигнатура, версия формата marshal,
+# mtime (нс) и размер JSON файла, blake2b хэш его содержимого
+CACHE_MAGIC = b'NFCV'
+CACHE_HEADER = struct.Struct('<4sHqq32s')
+
+
+def username_key(username: str) -> str:
+    """Логин для сравнения: без пробелов по краям и без учета регистра"""
+    return username.strip().casefold()
+
+
+def same_entry(existing: Dict, entry: Dict) -> bool:
+    """Относится ли обновление entry к записи existing"""
+    if existing.get('id'):
+        return existing['id'] == entry.get('id')
+    # Старые записи без id сопоставляются по логину
+    return username_key(existing.get('username', '')) == username_key(entry.get('username', ''))
+
+
+def apply_record(passwords: Dict, record: Dict):
+    """Применение записи журнала к хранилищу в памяти"""
+    op = record.get('op')
+    service = record.get('service')
+    entry = record.get('entry') or {}
+
+    if op == 'add':
+        entries = passwords.setdefault(service, [])
+        entry_id = entry.get('id')
+        # Запись могла уже попасть в снимок до обрезки журнала
+        if entry_id and any(e.get('id') == entry_id for e in entries):
+            return
+        entries.append(entry)
+    elif op == 'update':
+        entries = passwords.setdefault(service, [])
+        for i, existing in enumerate(entries):
+            if same_entry(existing, entry):
+                # Запись заменяется целиком, а не меняется на месте
+                entries[i] = entry
+                return
+        entries.append(entry)
+    else:
+        print(f"Неизвестная операция журнала: {op}")
+
+
+def deduplicate_passwords(passwords: Dict) -> Tuple[int, int]:
+    """Удаление дубликатов (сервис, логин), остается последняя запись
+
+    Возвращает число удаленных записей и примерный объем в байтах.
+    """
+    removed = 0
+    reclaimed = 0
+    for service, entries in passwords.items():
+        latest = {}
+        for entry in entries:
+            latest[username_key(entry.get('username', ''))] = entry
+        if len(latest) == len(entries):
+            continue
+
+        kept = [entry for entry in entries
+                if latest[username_key(entry.get('username', ''))] is entry]
+        for entry in entries:
+            if latest[username_key(entry.get('username', ''))] is not entry:
+                removed += 1
+                reclaimed += len(json.dumps(entry, indent=2, ensure_ascii=False).encode('utf-8'))
+        passwords[service] = kept
+    return removed, reclaimed
+
+
+def copy_passwords(passwords: Dict) -> Dict:
+    """Копия структуры хранилища для записи из другого потока
+
+    Записи не изменяются на месте, поэтому копируются только списки.
+    """
+    return {service: list(entries) for service, entries in passwords.items()}
+
+
+def write_file_atomic(path: str, data: bytes):
+    """Атомарная запись файла: временный файл, fsync и переименование"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotCache:
+    """Бинарный кэш JSON снимка для быстрого холодного старта
+
+    Кэш действителен, только если mtime, размер и хэш JSON файла
+    совпадают с записанными в заголовке.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def file_stamp(json_path: str, content: bytes) -> Tuple[int, int, bytes]:
+        stat = os.stat(json_path)
+        return stat.st_mtime_ns, stat.st_size, hashlib.blake2b(content, digest_size=32).digest()
+
+    def load(self, json_path: str, content: bytes) -> Optional[Dict]:
+        """Чтение кэша, None если он отсутствует или устарел"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            magic, version, mtime, size, digest = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC or version != marshal.version:
+                return None
+            if (mtime, size, digest) != self.file_stamp(json_path, content):
+                return None
+            return marshal.loads(data[CACHE_HEADER.size:])
+        except (IOError, struct.error, ValueError, EOFError, TypeError):
+            return None
+
+    def save(self, json_path: str, content: bytes, passwords: Dict):
+        """Запись кэша для текущего содержимого JSON файла"""
+        try:
+            mtime, size, digest = self.file_stamp(json_path, content)
+            header = CACHE_HEADER.pack(CACHE_MAGIC, marshal.version, mtime, size, digest)
+            write_file_atomic(self.path, header + marshal.dumps(passwords))
+        except (IOError, ValueError) as e:
+            print(f"Ошибка записи кэша: {e}")
+
+
+class JsonStorage:
+    """Хранение всего хранилища в одном JSON файле"""
+
+    # Запись можно выполнять в PersistenceWorker
+    background_io = True
+
+    def __init__(self, path: str, cache_path: Optional[str] = None):
+        self.path = path
+        self.cache = SnapshotCache(cache_path) if cache_path else None
+        # Выполненные однократные миграции хранилища
+        self.meta_path = path + '.meta'
+
+    def load(self) -> Dict:
+        """Загрузка паролей из файла"""
+        started = time.perf_counter()
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    content = f.read()
+
+                passwords = self.cache.load(self.path, content) if self.cache else None
+                source = 'кэш'
+                if passwords is None:
+                    passwords = json.loads(content.decode('utf-8'))
+                    source = 'JSON'
+                    if self.cache:
+                        self.cache.save(self.path, content, passwords)
+
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"Снимок загружен ({source}) за {elapsed:.1f} мс")
+                return passwords
+            else:
+                # Создаем пустой файл при первом запуске
+                default_data = {}
+                self.write_snapshot(default_data)
+                return default_data
+        except (ValueError, IOError) as e:
+            print(f"Ошибка загрузки паролей: {e}")
+            return {}
+
+    def write_snapshot(self, passwords: Dict) -> bool:
+        """Атомарная запись JSON файла целиком"""
+        try:
+            content = json.dumps(passwords, indent=2, ensure_ascii=False).encode('utf-8')
+            write_file_atomic(self.path, content)
+            if self.cache:
+                self.cache.save(self.path, content, passwords)
+            return True
+        except IOError as e:
+            print(f"Ошибка сохранения паролей: {e}")
+            return False
+
+    def prepare_save(self, passwords: Dict) -> Callable[[], bool]:
+        """Подготовка полной перезаписи; возвращает операцию ввода-вывода"""
+        snapshot = copy_passwords(passwords)
+        return lambda: self.write_snapshot(snapshot)
+
+    def prepare_commit(self, passwords: Dict, records: List[Dict]) -> Callable[[], bool]:
+        """Подготовка сохранения изменений (для JSON - полная перезапись)"""
+        return self.prepare_save(passwords)
+
+    def save(self, passwords: Dict) -> bool:
+        """Полная перезапись файла"""
+        return self.prepare_save(passwords)()
+
+    def commit(self, passwords: Dict, records: List[Dict]) -> bool:
+        """Сохранение изменений"""
+        return self.prepare_commit(passwords, records)()
+
+    def apply(self, passwords: Dict, record: Dict):
+        """Применение изменения к хранилищу в памяти"""
+        apply_record(passwords, record)
+
+    def deduplicate(self, passwords: Dict) -> Tuple[int, int]:
+        """Удаление дубликатов в памяти (запись на диск - save)"""
+        return deduplicate_passwords(passwords)
+
+    def load_meta(self) -> Dict:
+        if not os.path.exists(self.meta_path):
+            return {}
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, IOError) as e:
+            print(f"Ошибка чтения метаданных хранилища: {e}")
+            return {}
+
+    def is_migrated(self, name: str) -> bool:
+        """Выполнялась ли миграция name"""
+        return name in self.load_meta().get('migrations', [])
+
+    def mark_migrated(self, name: str) -> bool:
+        """Отметка о миграции (после записи ее результата)"""
+        meta = self.load_meta()
+        migrations = meta.setdefault('migrations', [])
+        if name not in migrations:
+            migrations.append(name)
+        try:
+            write_file_atomic(self.meta_path, json.dumps(meta).encode('utf-8'))
+            return True
+        except IOError as e:
+            print(f"Ошибка записи метаданных хранилища: {e}")
+            return False
+
+
+class JournalStorage(JsonStorage):
+    """JSON снимок плюс журнал изменений, дописываемый в конец
+
+    Каждая строка журнала: CRC32 в hex, пробел, JSON запись.
+    Оборванная или поврежденная последняя запись отбрасывается при загрузке.
+    """
+
+    def __init__(self, path: str, journal_path: str,
+                 compact_size: int = JOURNAL_COMPACT_SIZE,
+                 cache_path: Optional[str] = None):
+        super().__init__(path, cache_path)
+        self.journal_path = journal_path
+        self.compact_size = compact_size
+        self.journal_size = 0
+
+    @staticmethod
+    def encode_record(record: Dict) -> bytes:
+        """Кодирование записи в строку журнала"""
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+
+    @staticmethod
+    def decode_record(line: bytes) -> Optional[Dict]:
+        """Разбор строки журнала, None если запись повреждена"""
+        crc, sep, payload = line.partition(b' ')
+        if not sep or len(crc) != 8:
+            return None
+        try:
+            if int(crc, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def load(self) -> Dict:
+        """Загрузка снимка и воспроизведение журнала поверх него"""
+        passwords = super().load()
+        self.replay(passwords)
+        return passwords
+
+    def replay(self, passwords: Dict):
+        """Воспроизведение журнала с отбрасыванием оборванного хвоста"""
+        self.journal_size = 0
+        if not os.path.exists(self.journal_path):
+            return
+
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except IOError as e:
+            print(f"Ошибка чтения журнала: {e}")
+            return
+
+        pos = 0
+        count = 0
+        while pos < len(data):
+            end = data.find(b'\n', pos)
+            if end == -1:
+                break
+            record = self.decode_record(data[pos:end])
+            if record is None:
+                break
+            apply_record(passwords, record)
+            count += 1
+            pos = end + 1
+
+        if pos < len(data):
+            print(f"Журнал поврежден: отбрасываю {len(data) - pos} байт после записи {count}")
+            self.truncate_journal(pos)
+
+        self.journal_size = pos
+
+    def truncate_journal(self, size: int) -> bool:
+        """Обрезка журнала до заданного размера (файл не удлиняется)"""
+        if not os.path.exists(self.journal_path):
+            return True
+        try:
+            with open(self.journal_path, 'r+b') as f:
+                if f.seek(0, os.SEEK_END) <= size:
+                    return True
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+            return True
+        except IOError as e:
+            print(f"Ошибка обрезки журнала: {e}")
+            return False
+
+    def prepare_commit(self, passwords: Dict, records: List[Dict]) -> Callable[[], bool]:
+        """Подготовка дописывания изменений в журнал"""
+        blob = b''.join(self.encode_record(r) for r in records)
+        if self.journal_size + len(blob) >= self.compact_size:
+            # Изменения уже применены в памяти и попадут в снимок
+            return self.prepare_save(passwords)
+        return lambda: self.append_journal(blob)
+
+    def prepare_save(self, passwords: Dict) -> Callable[[], bool]:
+        """Подготовка сворачивания журнала в новый снимок"""
+        snapshot = copy_passwords(passwords)
+        return lambda: self.compact(snapshot)
+
+    def append_journal(self, blob: bytes) -> bool:
+        """Дописывание готовых записей в журнал
+
+        journal_size меняется только здесь и в compact (поток записи),
+        после успешной операции.
+        """
+        if not blob:
+            return True
+        offset = self.journal_size
+        try:
+            with open(self.journal_path, 'ab') as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+        except IOError as e:
+            print(f"Ошибка записи журнала: {e}")
+            # Не оставляем обрывок записи перед следующими
+            self.truncate_journal(offset)
+            return False
+        self.journal_size = offset + len(blob)
+        return True
+
+    def compact(self, passwords: Dict) -> bool:
+        """Сворачивание журнала в новый снимок"""
+        # Сначала снимок, затем обрезка журнала: при сбое между ними
+        # повторное воспроизведение отсеет записи по id
+        if not self.write_snapshot(passwords):
+            return False
+        if self.truncate_journal(0):
+            self.journal_size = 0
+        return True
+
+
+class SQLitePasswordView(Mapping):
+    """Словарь {сервис: [записи]} поверх SQLite без загрузки всей базы
+
+    Каждое обращение - индексированный запрос, поэтому старт и поиск
+    не зависят от размера хранилища.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __getitem__(self, service: str) -> List[Dict]:
+        entries = self.entries_for(service)
+        if not entries:
+            raise KeyError(service)
+        return entries
+
+    def __contains__(self, service) -> bool:
+        row = self.connection.execute(
+            'SELECT 1 FROM entries WHERE service = ? LIMIT 1', (service,)
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        cursor = self.connection.execute(
+            'SELECT DISTINCT service FROM entries ORDER BY service'
+        )
+        for (service,) in cursor:
+            yield service
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(DISTINCT service) FROM entries'
+        ).fetchone()[0]
+
+    def __bool__(self) -> bool:
+        return self.connection.execute('SELECT 1 FROM entries LIMIT 1').fetchone() is not None
+
+    def entries_for(self, service: str) -> List[Dict]:
+        """Записи одного сервиса в порядке добавления"""
+        cursor = self.connection.execute(
+            'SELECT data FROM entries WHERE service = ? ORDER BY seq', (service,)
+        )
+        return [json.loads(data) for (data,) in cursor]
+
+    def services_page(self, offset: int = 0, limit: int = 100) -> List[str]:
+        """Страница списка сервисов по алфавиту"""
+        cursor = self.connection.execute(
+            'SELECT DISTINCT service FROM entries ORDER BY service LIMIT ? OFFSET ?',
+            (limit, offset)
+        )
+        return [service for (service,) in cursor]
+
+    def find_entry(self, service: str, username: str) -> Optional[Dict]:
+        """Запись по паре (сервис, логин)"""
+        row = self.connection.execute(
+            'SELECT data FROM entries WHERE service = ? AND username_key = ? '
+            'ORDER BY seq DESC LIMIT 1',
+            (service, username_key(username))
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def search_prefix(self, query: str, limit: int = 50) -> List[str]:
+        """Сервисы, у которых сервис или логин начинается с query
+
+        Диапазонные запросы по индексам service_key и username_key
+        вместо индекса в памяти: время не зависит от размера хранилища.
+        """
+        low = query.casefold()
+        high = low + '\U0010ffff'
+        results = []
+        seen = set()
+        for column in ('service_key', 'username_key'):
+            cursor = self.connection.execute(
+                f'SELECT service FROM entries WHERE {column} >= ? AND {column} < ? ORDER BY {column}',
+                (low, high)
+            )
+            for (service,) in cursor:
+                if len(results) >= limit:
+                    return results
+                if service not in seen:
+                    seen.add(service)
+                    results.append(service)
+        return results
+
+    def iter_entries(self):
+        """Пары (сервис, запись) для индексации: только сервис и логин"""
+        cursor = self.connection.execute('SELECT service, username FROM entries ORDER BY seq')
+        for service, username in cursor:
+            yield service, {'username': username}
+
+    def find_by_username(self, username: str, offset: int = 0,
+                         limit: int = 100) -> List[Tuple[str, Dict]]:
+        """Поиск записей по имени пользователя (см. username_key)"""
+        cursor = self.connection.execute(
+            'SELECT service, data FROM entries WHERE username_key = ? '
+            'ORDER BY seq LIMIT ? OFFSET ?',
+            (username_key(username), limit, offset)
+        )
+        return [(service, json.loads(data)) for service, data in cursor]
+
+
+class SQLiteStorage:
+    """Хранение паролей в SQLite с индексами по сервису и логину"""
+
+    # Соединение привязано к главному потоку, фиксация транзакции дешевая
+    background_io = False
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries ('
+        ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+        ' id TEXT UNIQUE,'
+        ' service TEXT NOT NULL,'
+        ' service_key TEXT NOT NULL,'
+        ' username TEXT NOT NULL,'
+        ' username_key TEXT NOT NULL,'
+        ' data TEXT NOT NULL)',
+        # Выполненные однократные миграции
+        'CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY)',
+    )
+    # Логины сравниваются по username_key (как в JSON хранилище):
+    # COLLATE NOCASE учитывает только ASCII и не убирает пробелы
+    INDEXES = (
+        'DROP INDEX IF EXISTS idx_entries_service_username',
+        'DROP INDEX IF EXISTS idx_entries_username',
+        # Составной индекс: поиск по сервису и проверка уникальности пары
+        'CREATE INDEX IF NOT EXISTS idx_entries_service_key ON entries(service, username_key)',
+        'CREATE INDEX IF NOT EXISTS idx_entries_key ON entries(username_key)',
+        # Поиск сервисов по префиксу (search_prefix)
+        'CREATE INDEX IF NOT EXISTS idx_entries_service_fold ON entries(service_key)',
+    )
+
+    def __init__(self, path: str, import_from: Optional[JsonStorage] = None):
+        self.path = path
+        # Хранилище JSON (со своим журналом), из которого данные
+        # переносятся при первом запуске
+        self.import_from = import_from
+        self.connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            with self.connection:
+                for statement in self.SCHEMA:
+                    self.connection.execute(statement)
+                self.migrate_key_columns()
+                for statement in self.INDEXES:
+                    self.connection.execute(statement)
+        return self.connection
+
+    def migrate_key_columns(self):
+        """Столбцы username_key и service_key для баз, созданных до их появления"""
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(entries)')}
+        for column, source, key in (('username_key', 'username', username_key),
+                                    ('service_key', 'service', str.casefold)):
+            if column in columns:
+                continue
+            self.connection.execute(
+                f"ALTER TABLE entries ADD COLUMN {column} TEXT NOT NULL DEFAULT ''"
+            )
+            rows = self.connection.execute(f'SELECT seq, {source} FROM entries').fetchall()
+            self.connection.executemany(
+                f'UPDATE entries SET {column} = ? WHERE seq = ?',
+                ((key(value), seq) for seq, value in rows)
+            )
+
+    def load(self) -> SQLitePasswordView:
+        """Открытие базы; данные читаются по запросу"""
+        connection = self.connect()
+        view = SQLitePasswordView(connection)
+        if not view and self.import_from is not None:
+            self.import_storage(self.import_from)
+        return view
+
+    def import_storage(self, source: JsonStorage):
+        """Однократный перенос паролей из JSON снимка и журнала"""
+        paths = [source.path, getattr(source, 'journal_path', None)]
+        if not any(path and os.path.exists(path) for path in paths):
+            return
+        passwords = source.load()
+        self.replace_all(passwords)
+        print(f"Импортировано сервисов из {source.path}: {len(passwords)}")
+
+    def replace_all(self, passwords: Dict):
+        """Замена содержимого базы одной транзакцией"""
+        connection = self.connect()
+        with connection:
+            connection.execute('DELETE FROM entries')
+            for service, entries in passwords.items():
+                for entry in entries:
+                    self.insert(service, entry)
+
+    def insert(self, service: str, entry: Dict):
+        username = entry.get('username', '')
+        self.connection.execute(
+            'INSERT OR IGNORE INTO entries (id, service, service_key, username, username_key, data)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (entry.get('id'), service, service.casefold(), username, username_key(username),
+             json.dumps(entry, ensure_ascii=False))
+        )
+
+    def update(self, service: str, entry: Dict):
+        data = json.dumps(entry, ensure_ascii=False)
+        username = entry.get('username', '')
+        key = username_key(username)
+        cursor = self.connection.execute(
+            'UPDATE entries SET username = ?, username_key = ?, data = ? WHERE id = ?',
+            (username, key, data, entry.get('id'))
+        )
+        if cursor.rowcount == 0:
+            # Старая запись без id
+            cursor = self.connection.execute(
+                'UPDATE entries SET id = ?, username = ?, username_key = ?, data = ? WHERE seq = ('
+                ' SELECT MAX(seq) FROM entries WHERE service = ? AND username_key = ?)',
+                (entry.get('id'), username, key, data, service, key)
+            )
+        if cursor.rowcount == 0:
+            self.insert(service, entry)
+
+    def apply(self, passwords: Mapping, record: Dict):
+        """Изменение попадает в открытую транзакцию"""
+        op = record.get('op')
+        if op == 'add':
+            self.insert(record['service'], record['entry'])
+        elif op == 'update':
+            self.update(record['service'], record['entry'])
+        else:
+            print(f"Неизвестная операция: {op}")
+
+    def deduplicate(self, passwords: Mapping) -> Tuple[int, int]:
+        """Удаление дубликатов (сервис, логин), остается последняя запись"""
+        duplicates = (
+            'FROM entries WHERE seq NOT IN ('
+            ' SELECT MAX(seq) FROM entries GROUP BY service, username_key)'
+        )
+        connection = self.connect()
+        removed, reclaimed = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) ' + duplicates
+        ).fetchone()
+        if removed:
+            connection.execute('DELETE ' + duplicates)
+        return removed, reclaimed
+
+    def is_migrated(self, name: str) -> bool:
+        """Выполнялась ли миграция name"""
+        return self.connect().execute(
+            'SELECT 1 FROM migrations WHERE name = ?', (name,)
+        ).fetchone() is not None
+
+    def mark_migrated(self, name: str) -> bool:
+        """Отметка о миграции; фиксируется вместе с открытой транзакцией"""
+        self.connect().execute('INSERT OR IGNORE INTO migrations (name) VALUES (?)', (name,))
+        return self.commit_transaction()
+
+    def commit_transaction(self) -> bool:
+        """Фиксация транзакции"""
+        try:
+            self.connection.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Ошибка сохранения паролей: {e}")
+            return False
+
+    def prepare_commit(self, passwords: Mapping, records: List[Dict]) -> Callable[[], bool]:
+        return self.commit_transaction
+
+    def prepare_save(self, passwords: Mapping) -> Callable[[], bool]:
+        """Полная перезапись (для представления базы - просто фиксация)"""
+        if isinstance(passwords, SQLitePasswordView):
+            return self.commit_transaction
+        snapshot = copy_passwords(passwords)
+        return lambda: self.replace_all(snapshot) or True
+
+    def commit(self, passwords: Mapping, records: List[Dict]) -> bool:
+        return self.prepare_commit(passwords, records)()
+
+    def save(self, passwords: Mapping) -> bool:
+        return self.prepare_save(passwords)()
+
+
+class PersistenceWorker:
+    """Поток ввода-вывода хранилища с ограниченной очередью
+
+    Операции выполняются по порядку. Результат передается в callback
+    через schedule (в приложении - Clock.schedule_once).
+    """
+
+    def __init__(self, schedule: Optional[Callable] = None,
+                 maxsize: int = PERSIST_QUEUE_SIZE):
+        self.schedule = schedule
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self.run, name='vault-io', daemon=True)
+        self.thread.start()
+
+    def submit(self, job: Callable, callback: Optional[Callable] = None):
+        """Постановка операции в очередь (блокирует при переполнении)"""
+        self.queue.put((job, callback))
+
+    def run(self):
+        while True:
+            job, callback = self.queue.get()
+            try:
+                if job is None:
+                    return
+                try:
+                    result = job()
+                except Exception as e:
+                    print(f"Ошибка операции хранилища: {e}")
+                    result = None
+                if callback is not None:
+                    self.deliver(callback, result)
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, callback: Callable, result):
+        """Передача результата в главный поток"""
+        if self.schedule is not None:
+            self.schedule(lambda dt: callback(result))
+        else:
+            callback(result)
+
+    def drain(self):
+        """Синхронное ожидание всех поставленных операций"""
+        self.queue.join()
+
+    def stop(self):
+        """Завершение потока после выполнения очереди"""
+        self.queue.put((None, None))
+        self.thread.join()
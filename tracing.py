@@ -0,0 +1,186 @@
+"""
+Tracing
+Замеры времени операций в формате Chrome Trace Event
+(открывается в chrome://tracing и ui.perfetto.dev)
+
+По умолчанию выключено: span() возвращает пустой контекст, функции
+с @traced вызываются напрямую после проверки одного флага.
+Включение: переменная окружения NFC_TRACE=1 или enable() во время работы.
+
+События копятся в памяти и дописываются в TRACE_FILE пачками. Файл -
+массив JSON без закрывающей скобки (формат это допускает), поэтому
+запись продолжается после перезапуска. Файл больше TRACE_MAX_BYTES
+переименовывается в TRACE_FILE.1 (старые копии сдвигаются до TRACE_BACKUPS).
+"""
+
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+TRACE_FILE = 'nfc_trace.json'
+TRACE_MAX_BYTES = 1024 * 1024
+TRACE_BACKUPS = 2
+# Событий в памяти до записи в файл
+TRACE_FLUSH_EVENTS = 256
+
+# Пустой контекст для выключенной трассировки
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    """Замер одного интервала (событие 'X')"""
+
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'started')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.started, **self.args)
+        return False
+
+
+class Tracer:
+    """Сбор событий и запись в файл трассировки"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self.enabled = False
+        self.events: List[Dict] = []
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.pid = os.getpid()
+        # Потоки, для которых уже записано имя
+        self.named_threads = set()
+        # Отметки perf_counter переводятся во время эпохи (мкс),
+        # чтобы события разных запусков в одном файле шли по порядку
+        self.origin = time.time() - time.perf_counter()
+
+    def enable(self, path: Optional[str] = None):
+        if path:
+            self.path = path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.flush()
+
+    def span(self, name: str, cat: str = 'app', **args):
+        """Контекст замера: with tracer.span('kdf', 'crypto'): ..."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def record(self, name: str, cat: str, started: float, ended: Optional[float] = None, **args):
+        """Интервал по отметкам time.perf_counter()"""
+        if not self.enabled:
+            return
+        if ended is None:
+            ended = time.perf_counter()
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': round((self.origin + started) * 1e6),
+            'dur': round((ended - started) * 1e6),
+            'pid': self.pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+
+        with self.lock:
+            if tid not in self.named_threads:
+                self.named_threads.add(tid)
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                                    'tid': tid, 'args': {'name': thread.name}})
+            self.events.append(event)
+            full = len(self.events) >= TRACE_FLUSH_EVENTS
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Дописывание накопленных событий в файл"""
+        with self.lock:
+            events, self.events = self.events, []
+        if not events:
+            return
+        with self.file_lock:
+            try:
+                self.rotate()
+                new_file = not os.path.exists(self.path)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    if new_file:
+                        f.write('[\n')
+                    f.write(''.join(json.dumps(event, ensure_ascii=False) + ',\n' for event in events))
+            except IOError as e:
+                print(f"Ошибка записи трассировки: {e}")
+
+    def rotate(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < TRACE_MAX_BYTES:
+            return
+        for index in range(TRACE_BACKUPS - 1, 0, -1):
+            older = f'{self.path}.{index}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{index + 1}')
+        os.replace(self.path, f'{self.path}.1')
+        # Имена потоков нужны и в новом файле
+        self.named_threads.clear()
+
+
+tracer = Tracer()
+atexit.register(tracer.flush)
+
+if os.environ.get('NFC_TRACE'):
+    tracer.enable()
+
+
+def span(name: str, cat: str = 'app', **args):
+    return tracer.span(name, cat, **args)
+
+
+def record(name: str, cat: str, started: float, ended: Optional[float] = None, **args):
+    tracer.record(name, cat, started, ended, **args)
+
+
+def traced(name: Optional[str] = None, cat: str = 'app'):
+    """Декоратор: замер каждого вызова функции"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, label, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable(path: Optional[str] = None):
+    tracer.enable(path)
+
+
+def disable():
+    tracer.disable()
+
+
+def flush():
+    tracer.flush()
@@ -0,0 +1,772 @@
+"""
+Vault Core
+Хранилище паролей и шифрование без зависимости от Kivy
+
+Используется приложением (main.py) и командной строкой (cli.py).
+Отложенные вызовы идут через планировщик: в приложении это kivy Clock,
+без цикла событий - DirectScheduler. Модули Crypto импортируются при
+первом шифровании, чтобы не задерживать запуск.
+"""
+
+import os
+import json
+import time
+import uuid
+import struct
+import threading
+import base64
+import zlib
+import hashlib
+from datetime import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from storage import JsonStorage, JournalStorage, SQLiteStorage, PersistenceWorker, username_key
+from search_index import SearchIndex, UsernameIndex
+import payload
+import tracing
+
+# Конфигурация
+CONFIG_FILE = 'nfc_passwords.json'
+JOURNAL_FILE = 'nfc_passwords.journal'
+SNAPSHOT_CACHE_FILE = 'nfc_passwords.cache'
+DATABASE_FILE = 'nfc_passwords.db'
+# Режим хранения: 'json' - полная перезапись, 'journal' - снимок + журнал,
+# 'sqlite' - база с индексами для больших хранилищ
+STORAGE_MODE = 'journal'
+# Задержка группового сохранения (сек) и максимальное ожидание записи
+SAVE_DELAY = 0.5
+SAVE_MAX_DELAY = 3
+# Имя однократной миграции удаления дубликатов в метаданных хранилища
+DEDUPLICATE_MIGRATION = 'deduplicate'
+
+# Формирование ключа: PBKDF2-HMAC-SHA256 с солью в каждом шифре.
+# Заголовок шифра: сигнатура с версией, число итераций, соль
+KDF_SETTINGS_FILE = 'nfc_kdf.json'
+KDF_TARGET_SECONDS = 0.25
+# Большее число итераций в заголовке шифра считается повреждением:
+# иначе чужие данные могут надолго занять поток шифрования
+KDF_MIN_ITERATIONS = payload.MIN_ITERATIONS
+KDF_MAX_ITERATIONS = payload.MAX_ITERATIONS
+KDF_MAGIC = b'NK\x01'
+KDF_HEADER = struct.Struct('<3sI16s')
+# Кэш производных ключей: число ключей и время жизни (сек)
+KEY_CACHE_SIZE = 16
+KEY_CACHE_TTL = 300
+# Кэш расшифрованных меток: число меток и время жизни (сек)
+READ_CACHE_SIZE = 32
+READ_CACHE_TTL = 120
+# Сколько заданий пакетного шифрования держать в работе одновременно
+BATCH_WINDOW = 64
+
+
+class ManualTrigger:
+    """Отложенный вызов, который срабатывает только явно"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.pending = False
+
+    def __call__(self, *args):
+        self.pending = True
+
+    def cancel(self):
+        self.pending = False
+
+
+class DirectScheduler:
+    """Планировщик без цикла событий (интерфейс kivy Clock)
+
+    schedule_once вызывает callback сразу в текущем потоке, триггеры
+    не срабатывают сами: накопленные изменения хранилища записываются
+    явным flush_passwords() или drain().
+    """
+
+    @staticmethod
+    def schedule_once(callback, timeout=0):
+        callback(0)
+
+    @staticmethod
+    def create_trigger(callback, timeout=0):
+        return ManualTrigger(callback)
+
+
+class PasswordManager:
+    """Менеджер паролей"""
+
+    def __init__(self, storage=None, worker: Optional[PersistenceWorker] = None,
+                 scheduler=None, index_search: bool = True):
+        self.storage = storage or self.create_storage()
+        # Файловые хранилища пишутся в отдельном потоке
+        self.worker = worker if self.storage.background_io else None
+        # kivy Clock в приложении
+        self.scheduler = scheduler or DirectScheduler()
+        # Без поискового индекса (пакетные операции командной строки)
+        self.index_search = index_search
+
+        # Изменения, ожидающие записи на диск
+        self.pending_records = []
+        self.dirty_since = None
+        # Запись не удалась: следующий сброс - полная перезапись
+        self.save_failed = False
+        self.flush_trigger = self.scheduler.create_trigger(self.flush_passwords, SAVE_DELAY)
+
+        # Подписчики на изменения: callback(event, service),
+        # event - 'added', 'updated', 'reset' или 'indexed'
+        self.change_listeners = []
+
+        # Поисковый индекс строится в фоне после загрузки
+        self.search_index = None
+        self.index_backlog = None
+        self.index_generation = 0
+        # Обратный индекс логинов строится при первом запросе
+        self.username_index = None
+        # Индекс уникальности (сервис, логин) -> запись
+        self.entry_index = None
+
+        self.loaded = False
+        self.loaded_callbacks = []
+        if self.worker:
+            self.passwords = {}
+            self.worker.submit(self.load_passwords, self.finish_loading)
+        else:
+            self.finish_loading(self.load_passwords())
+
+    @staticmethod
+    def create_storage():
+        """Создание хранилища согласно STORAGE_MODE"""
+        if STORAGE_MODE == 'journal':
+            return JournalStorage(CONFIG_FILE, JOURNAL_FILE, cache_path=SNAPSHOT_CACHE_FILE)
+        if STORAGE_MODE == 'sqlite':
+            return SQLiteStorage(DATABASE_FILE, import_from=JournalStorage(CONFIG_FILE, JOURNAL_FILE))
+        return JsonStorage(CONFIG_FILE, cache_path=SNAPSHOT_CACHE_FILE)
+
+    @tracing.traced('storage.load', 'storage')
+    def load_passwords(self) -> Dict:
+        """Загрузка паролей из файла"""
+        return self.storage.load()
+
+    def finish_loading(self, passwords):
+        """Пароли загружены (вызывается в главном потоке)"""
+        # Изменения, сделанные до окончания загрузки
+        for record in self.pending_records:
+            self.storage.apply(passwords, record)
+
+        self.passwords = passwords
+        self.loaded = True
+        self.username_index = None
+        self.entry_index = None
+        self.notify_change('reset')
+        self.build_search_index()
+        callbacks, self.loaded_callbacks = self.loaded_callbacks, []
+        for callback in callbacks:
+            callback()
+
+        if self.pending_records:
+            self.flush_trigger()
+
+    def when_loaded(self, callback):
+        """Вызов callback после загрузки паролей"""
+        if self.loaded:
+            callback()
+        else:
+            self.loaded_callbacks.append(callback)
+
+    def add_change_listener(self, callback):
+        """Подписка на изменения хранилища"""
+        self.change_listeners.append(callback)
+
+    def remove_change_listener(self, callback):
+        if callback in self.change_listeners:
+            self.change_listeners.remove(callback)
+
+    def notify_change(self, event: str, service: Optional[str] = None):
+        """Оповещение подписчиков об изменении"""
+        for callback in list(self.change_listeners):
+            callback(event, service)
+
+    def iter_entries(self):
+        """Все записи парами (сервис, запись)"""
+        if hasattr(self.passwords, 'iter_entries'):
+            return self.passwords.iter_entries()
+        return ((service, entry)
+                for service, entries in self.passwords.items()
+                for entry in entries)
+
+    def build_search_index(self):
+        """Построение поискового индекса в фоновом потоке
+
+        В SQLite поиск идет запросами по индексам базы, без индекса в памяти.
+        """
+        if not self.index_search or hasattr(self.passwords, 'search_prefix'):
+            return
+        self.index_generation += 1
+        generation = self.index_generation
+        self.search_index = None
+        # Записи, добавленные во время построения
+        self.index_backlog = []
+        entries = list(self.iter_entries())
+
+        def build():
+            index = SearchIndex()
+            index.build(entries)
+            self.scheduler.schedule_once(lambda dt: self.finish_search_index(index, generation))
+
+        threading.Thread(target=build, name='search-index', daemon=True).start()
+
+    def finish_search_index(self, index: SearchIndex, generation: int):
+        if generation != self.index_generation:
+            return
+        for service, entry in self.index_backlog:
+            index.add_entry(service, entry)
+        self.index_backlog = None
+        self.search_index = index
+        self.notify_change('indexed')
+
+    def search(self, query: str, limit: int = 50) -> List[str]:
+        """Поиск сервисов по префиксу и нечеткому совпадению"""
+        if hasattr(self.passwords, 'search_prefix'):
+            return self.passwords.search_prefix(query, limit)
+        if self.search_index is not None:
+            return self.search_index.search(query, limit)
+
+        # Пока индекс строится - простой перебор по префиксу
+        query = query.casefold()
+        return [service for service in self.get_services()
+                if service.casefold().startswith(query)][:limit]
+
+    def find_by_username(self, username: str) -> Dict[str, Set[str]]:
+        """Где используется логин: {сервис: id записей}"""
+        if hasattr(self.passwords, 'find_by_username'):
+            result = {}
+            for service, entry in self.passwords.find_by_username(username, limit=-1):
+                result.setdefault(service, set()).add(entry.get('id'))
+            return result
+
+        if self.username_index is None:
+            self.username_index = UsernameIndex()
+            self.username_index.build(self.iter_entries())
+        return self.username_index.services_for(username)
+
+    def get_services_for_username(self, username: str) -> List[str]:
+        """Сервисы, где используется логин"""
+        return list(self.find_by_username(username))
+
+    def run_io(self, job):
+        """Выполнение операции записи в потоке ввода-вывода или сразу"""
+        job = tracing.traced('storage.write', 'storage')(job)
+        if self.worker:
+            self.worker.submit(job, self.on_io_done)
+        else:
+            self.on_io_done(job())
+
+    def on_io_done(self, success):
+        if not success:
+            print("Изменения не сохранены на диск")
+            self.save_failed = True
+
+    @tracing.traced('storage.save', 'storage')
+    def save_passwords(self, after: Optional[Callable[[], bool]] = None):
+        """Сохранение паролей в файл; after - операция после успешной записи"""
+        if not self.loaded:
+            print("Пароли еще не загружены, сохранение пропущено")
+            return
+        self.flush_trigger.cancel()
+        self.pending_records = []
+        self.dirty_since = None
+        self.save_failed = False
+        job = self.storage.prepare_save(self.passwords)
+        self.run_io(job if after is None else lambda: job() and after())
+
+    def mark_dirty(self, record: Dict):
+        """Отложенное сохранение изменения"""
+        self.pending_records.append(record)
+        now = time.monotonic()
+        if self.dirty_since is None:
+            self.dirty_since = now
+
+        # Переносим сброс, пока поток изменений не прекратится,
+        # но не дольше SAVE_MAX_DELAY с первого изменения
+        if now - self.dirty_since < SAVE_MAX_DELAY:
+            self.flush_trigger.cancel()
+        self.flush_trigger()
+
+    def flush_passwords(self, *args):
+        """Запись накопленных изменений одной операцией"""
+        self.flush_trigger.cancel()
+        # До окончания загрузки изменения копятся в pending_records
+        if not self.loaded:
+            return
+        if self.save_failed:
+            # Изменения из неудачной записи есть только в памяти
+            self.save_passwords()
+            return
+        if not self.pending_records:
+            return
+
+        records = self.pending_records
+        self.pending_records = []
+        self.dirty_since = None
+        self.run_io(self.storage.prepare_commit(self.passwords, records))
+
+    def drain(self):
+        """Синхронная запись всех изменений (при остановке)"""
+        self.flush_passwords()
+        if self.worker:
+            self.worker.drain()
+
+    def find_entry(self, service: str, username: str) -> Optional[Dict]:
+        """Запись по паре (сервис, логин)"""
+        if hasattr(self.passwords, 'find_entry'):
+            return self.passwords.find_entry(service, username)
+
+        if self.entry_index is None:
+            self.entry_index = {
+                (s, username_key(entry.get('username', ''))): entry
+                for s, entry in self.iter_entries()
+            }
+        return self.entry_index.get((service, username_key(username)))
+
+    def add_password(self, service: str, username: str, password: str):
+        """Добавление пароля; существующая пара (сервис, логин) обновляется"""
+        now = datetime.now().isoformat()
+        existing = self.find_entry(service, username)
+        if existing is not None:
+            # Повторное чтение той же метки ничего не меняет
+            if existing.get('password') == password and existing.get('username') == username:
+                return
+            entry = dict(existing, username=username, password=password, updated=now)
+            entry['id'] = existing.get('id') or uuid.uuid4().hex
+            record = {'op': 'update', 'service': service, 'entry': entry}
+        else:
+            entry = {
+                'id': uuid.uuid4().hex,
+                'username': username,
+                'password': password,
+                'created': now
+            }
+            record = {'op': 'add', 'service': service, 'entry': entry}
+
+        is_new = service not in self.passwords
+        self.storage.apply(self.passwords, record)
+        self.mark_dirty(record)
+
+        if self.entry_index is not None:
+            self.entry_index[(service, username_key(username))] = entry
+        if existing is None:
+            if self.username_index is not None:
+                self.username_index.add(service, entry)
+            if self.search_index is not None:
+                self.search_index.add_entry(service, entry)
+            elif self.index_backlog is not None:
+                self.index_backlog.append((service, entry))
+        self.notify_change('added' if is_new else 'updated', service)
+
+    def deduplicate(self) -> Tuple[int, int]:
+        """Однократное удаление дубликатов (сервис, логин)
+
+        Возвращает число удаленных записей и освобожденный объем в байтах.
+        Проход отмечается в хранилище после записи результата и при
+        следующих запусках не повторяется.
+        """
+        if self.storage.is_migrated(DEDUPLICATE_MIGRATION):
+            return 0, 0
+
+        removed, reclaimed = self.storage.deduplicate(self.passwords)
+
+        def mark():
+            return self.storage.mark_migrated(DEDUPLICATE_MIGRATION)
+
+        if removed:
+            self.entry_index = None
+            self.username_index = None
+            self.save_passwords(after=mark)
+            self.notify_change('reset')
+            self.build_search_index()
+        else:
+            self.run_io(mark)
+        return removed, reclaimed
+
+    def get_services(self) -> List[str]:
+        """Получение списка сервисов"""
+        return list(self.passwords.keys())
+
+    def iter_credentials(self, services: Optional[Iterable[str]] = None) -> Iterator[Dict[str, str]]:
+        """Учетные записи сервисов (по умолчанию всех) в виде полей метки"""
+        if services is None:
+            services = self.get_services()
+        for service in services:
+            for entry in self.passwords.get(service, ()):
+                yield {
+                    'service': service,
+                    'username': entry.get('username', ''),
+                    'password': entry.get('password', '')
+                }
+
+    def get_services_page(self, offset: int = 0, limit: int = 100) -> List[str]:
+        """Получение страницы списка сервисов"""
+        if hasattr(self.passwords, 'services_page'):
+            return self.passwords.services_page(offset, limit)
+        return list(islice(self.passwords.keys(), offset, offset + limit))
+
+
+class SessionKeyCache:
+    """Кэш производных ключей на время сессии
+
+    Ограничен по размеру и времени жизни, очищается при выходе и паузе.
+    """
+
+    def __init__(self, max_size: int = KEY_CACHE_SIZE, ttl: float = KEY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, cache_key) -> Optional[bytes]:
+        with self.lock:
+            item = self.keys.get(cache_key)
+            if item is None:
+                self.stats['misses'] += 1
+                return None
+            key, expires = item
+            if expires < time.monotonic():
+                del self.keys[cache_key]
+                self.stats['misses'] += 1
+                return None
+            self.keys.move_to_end(cache_key)
+            self.stats['hits'] += 1
+            return key
+
+    def put(self, cache_key, key: bytes):
+        with self.lock:
+            self.keys[cache_key] = (key, time.monotonic() + self.ttl)
+            self.keys.move_to_end(cache_key)
+            while len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+
+
+class TagReadCache(SessionKeyCache):
+    """Расшифрованные метки по UID и хэшу содержимого
+
+    Ключ зависит от PIN, поэтому с другим PIN кэш не срабатывает.
+    """
+
+    def __init__(self, max_size: int = READ_CACHE_SIZE, ttl: float = READ_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    @staticmethod
+    def make_key(uid: bytes, data: Union[bytes, str], pin: str) -> Tuple[bytes, bytes]:
+        if isinstance(data, str):
+            data = data.strip().encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16, key=pin.encode()[:64]).digest()
+        return uid, digest
+
+    def lookup(self, uid: bytes, data: Union[bytes, str], pin: str) -> Optional[List[Dict[str, str]]]:
+        credentials = self.get(self.make_key(uid, data, pin))
+        return [dict(fields) for fields in credentials] if credentials is not None else None
+
+    def store(self, uid: bytes, data: Union[bytes, str], pin: str, credentials: List[Dict[str, str]]):
+        self.put(self.make_key(uid, data, pin), [dict(fields) for fields in credentials])
+
+
+class EncryptionManager:
+    """Менеджер шифрования"""
+
+    key_cache = SessionKeyCache()
+    read_cache = TagReadCache()
+    # Доставка результатов run_async, в приложении - kivy Clock
+    scheduler = DirectScheduler()
+    kdf_lock = threading.Lock()
+    kdf_settings = None
+    executor = None
+    batch_executor = None
+
+    @staticmethod
+    def derive_key(pin: str, salt: Optional[bytes] = None, iterations: int = 0) -> bytes:
+        """Создание ключа из PIN
+
+        Без соли - старый формат (один SHA-256), иначе PBKDF2-HMAC-SHA256.
+        """
+        if salt is None:
+            return hashlib.sha256(pin.encode()).digest()
+
+        cache_key = (pin, salt, iterations)
+        key = EncryptionManager.key_cache.get(cache_key)
+        if key is None:
+            with tracing.span('kdf.derive', 'crypto', iterations=iterations):
+                key = hashlib.pbkdf2_hmac('sha256', pin.encode(), salt, iterations)
+            EncryptionManager.key_cache.put(cache_key, key)
+        return key
+
+    @staticmethod
+    def kdf_iterations() -> int:
+        """Число итераций KDF, подобранное под устройство при первом запуске"""
+        with EncryptionManager.kdf_lock:
+            if EncryptionManager.kdf_settings is None:
+                EncryptionManager.kdf_settings = EncryptionManager.load_kdf_settings()
+            return EncryptionManager.kdf_settings['iterations']
+
+    @staticmethod
+    def load_kdf_settings() -> Dict:
+        """Чтение калибровки KDF или калибровка, если ее еще нет"""
+        try:
+            if os.path.exists(KDF_SETTINGS_FILE):
+                with open(KDF_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Ошибка чтения настроек KDF: {e}")
+
+        settings = {'iterations': EncryptionManager.calibrate_kdf()}
+        try:
+            with open(KDF_SETTINGS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(settings, f)
+        except IOError as e:
+            print(f"Ошибка сохранения настроек KDF: {e}")
+        return settings
+
+    @staticmethod
+    @tracing.traced('kdf.calibrate', 'crypto')
+    def calibrate_kdf() -> int:
+        """Подбор числа итераций под KDF_TARGET_SECONDS на этом устройстве"""
+        probe = 10000
+        started = time.perf_counter()
+        hashlib.pbkdf2_hmac('sha256', b'0000', b'calibration-salt', probe)
+        elapsed = max(time.perf_counter() - started, 1e-6)
+
+        iterations = int(probe * KDF_TARGET_SECONDS / elapsed)
+        iterations = min(KDF_MAX_ITERATIONS, max(KDF_MIN_ITERATIONS, iterations // 1000 * 1000))
+        print(f"Калибровка KDF: {iterations} итераций (~{KDF_TARGET_SECONDS * 1000:.0f} мс)")
+        return iterations
+
+    @staticmethod
+    @tracing.traced('crypto.encrypt_text', 'crypto')
+    def encrypt_data(data: str, pin: str) -> str:
+        """Шифрование данных"""
+        from Crypto.Random import get_random_bytes
+        salt = get_random_bytes(16)
+        iterations = EncryptionManager.kdf_iterations()
+        key = EncryptionManager.derive_key(pin, salt, iterations)
+        return EncryptionManager.encrypt_with_key(data, key, salt, iterations)
+
+    @staticmethod
+    def encrypt_with_key(data: str, key: bytes, salt: bytes, iterations: int) -> str:
+        """Шифрование готовым ключом, случайный iv для каждого шифра"""
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import pad
+        from Crypto.Random import get_random_bytes
+
+        iv = get_random_bytes(16)
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+
+        encrypted = cipher.encrypt(pad(data.encode(), AES.block_size))
+        header = KDF_HEADER.pack(KDF_MAGIC, iterations, salt)
+        result = base64.b64encode(header + iv + encrypted).decode()
+        return result
+
+    @staticmethod
+    def parse_payload(encrypted_data: str):
+        """Разбор шифра: (соль, итерации, iv + шифртекст) или None
+
+        Для старого формата соль - None.
+        """
+        try:
+            data = base64.b64decode(encrypted_data)
+        except Exception as e:
+            print(f"Ошибка дешифровки: {e}")
+            return None
+
+        if data.startswith(KDF_MAGIC) and len(data) >= KDF_HEADER.size + 32:
+            magic, iterations, salt = KDF_HEADER.unpack_from(data)
+            if KDF_MIN_ITERATIONS <= iterations <= KDF_MAX_ITERATIONS:
+                return salt, iterations, data[KDF_HEADER.size:]
+            # Недопустимое число итераций: заголовок поврежден
+            # или совпадение сигнатуры случайно - только старый формат
+        return None, 0, data
+
+    @staticmethod
+    def decrypt_parsed(parsed, pin: str, key: Optional[bytes] = None) -> Optional[str]:
+        """Расшифровка разобранного шифра"""
+        if parsed is None:
+            return None
+        salt, iterations, body = parsed
+
+        if salt is not None:
+            if key is None:
+                key = EncryptionManager.derive_key(pin, salt, iterations)
+            decrypted = EncryptionManager.decrypt_block(body, key)
+            if decrypted is not None:
+                return decrypted
+            # Совпадение сигнатуры могло быть случайным - пробуем старый формат
+            body = KDF_HEADER.pack(KDF_MAGIC, iterations, salt) + body
+
+        # Старый формат: iv + шифртекст, ключ - SHA-256 от PIN
+        decrypted = EncryptionManager.decrypt_block(body, EncryptionManager.derive_key(pin))
+        if decrypted is None:
+            print("Ошибка дешифровки: неверный PIN или данные повреждены")
+        return decrypted
+
+    @staticmethod
+    @tracing.traced('crypto.decrypt_text', 'crypto')
+    def decrypt_data(encrypted_data: str, pin: str) -> Optional[str]:
+        """Расшифрование данных"""
+        return EncryptionManager.decrypt_parsed(EncryptionManager.parse_payload(encrypted_data), pin)
+
+    @staticmethod
+    def encrypt_credential(fields: Dict[str, str], pin: str, use_compression: bool = True,
+                           salt: Optional[bytes] = None) -> bytes:
+        """Шифрование учетной записи в компактный бинарный формат метки"""
+        return EncryptionManager.seal(payload.encode_fields(fields), 0, pin, use_compression, salt)
+
+    @staticmethod
+    def encrypt_container(credentials: List[Dict[str, str]], pin: str) -> bytes:
+        """Шифрование нескольких учетных записей для одной метки"""
+        return EncryptionManager.seal(payload.encode_container(credentials),
+                                      payload.FLAG_CONTAINER, pin)
+
+    @staticmethod
+    @tracing.traced('crypto.seal', 'crypto')
+    def seal(plaintext: bytes, flags: int, pin: str, use_compression: bool = True,
+             salt: Optional[bytes] = None) -> bytes:
+        """Сжатие и шифрование открытого текста в бинарный формат
+
+        С общей солью пакет шифров использует один ключ (nonce у каждого свой).
+        """
+        from Crypto.Cipher import AES
+        from Crypto.Random import get_random_bytes
+
+        dictionary = 0
+        if use_compression:
+            plaintext, compression, dictionary = payload.compress(plaintext)
+            flags |= compression
+
+        salt = salt or get_random_bytes(payload.SALT_SIZE)
+        nonce = get_random_bytes(payload.NONCE_SIZE)
+        iterations = EncryptionManager.kdf_iterations()
+        key = EncryptionManager.derive_key(pin, salt, iterations)
+
+        header = payload.pack_header(flags, iterations, salt, nonce, dictionary)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=payload.TAG_SIZE)
+        cipher.update(header)
+        encrypted, tag = cipher.encrypt_and_digest(plaintext)
+        return header + encrypted + tag
+
+    @staticmethod
+    @tracing.traced('crypto.open', 'crypto')
+    def decrypt_credentials(data: bytes, pin: str) -> Optional[List[Dict[str, str]]]:
+        """Расшифровка бинарного формата метки: одна или несколько записей"""
+        from Crypto.Cipher import AES
+
+        try:
+            flags, dictionary, iterations, salt, nonce, start = payload.unpack_header(data)
+            key = EncryptionManager.derive_key(pin, salt, iterations)
+
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=payload.TAG_SIZE)
+            cipher.update(data[:start])
+            plaintext = cipher.decrypt_and_verify(data[start:-payload.TAG_SIZE],
+                                                  data[-payload.TAG_SIZE:])
+            plaintext = payload.decompress(plaintext, flags, dictionary)
+            if flags & payload.FLAG_CONTAINER:
+                return payload.decode_container(plaintext)
+            return [payload.decode_fields(plaintext)]
+        except (ValueError, KeyError, zlib.error) as e:
+            print(f"Ошибка дешифровки: {e}")
+            return None
+
+    @staticmethod
+    def decrypt_tag_entries(data: Union[bytes, str], pin: str) -> Optional[List[Dict[str, str]]]:
+        """Расшифровка данных метки с автоопределением формата"""
+        if isinstance(data, str):
+            data = payload.text_to_payload(data.strip())
+        if isinstance(data, bytes):
+            if payload.is_binary_payload(data):
+                credentials = EncryptionManager.decrypt_credentials(data, pin)
+                if credentials is not None:
+                    return credentials
+                # Сигнатура могла совпасть случайно - пробуем старый формат
+                data = base64.b64encode(data).decode()
+            else:
+                # Старый формат хранится на метке как base64 текст
+                data = data.decode('ascii', errors='replace')
+
+        decrypted = EncryptionManager.decrypt_data(data, pin)
+        if decrypted is None:
+            return None
+        try:
+            return [json.loads(decrypted)]
+        except json.JSONDecodeError as e:
+            print(f"Ошибка разбора данных: {e}")
+            return None
+
+    @staticmethod
+    def batch_pool() -> ThreadPoolExecutor:
+        """Пул потоков для пакетной обработки"""
+        if EncryptionManager.batch_executor is None:
+            EncryptionManager.batch_executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 2, thread_name_prefix='crypto')
+        return EncryptionManager.batch_executor
+
+    @staticmethod
+    def ordered_map(func, items, window: int = BATCH_WINDOW) -> Iterator:
+        """Параллельная обработка с выдачей результатов в исходном порядке
+
+        В работе не больше window заданий, поэтому результаты отдаются
+        по мере готовности без накопления всего пакета.
+        """
+        pool = EncryptionManager.batch_pool()
+        futures = deque()
+        for item in items:
+            futures.append(pool.submit(func, *item))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    @staticmethod
+    def decrypt_block(data: bytes, key: bytes) -> Optional[str]:
+        """Расшифровка iv + AES-CBC шифртекста"""
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import unpad
+
+        try:
+            iv = data[:16]
+            encrypted = data[16:]
+
+            cipher = AES.new(key, AES.MODE_CBC, iv)
+            decrypted = unpad(cipher.decrypt(encrypted), AES.block_size)
+            return decrypted.decode()
+        except (ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def run_async(func, callback, *args):
+        """Выполнение в потоке шифрования, результат в главном потоке через Clock"""
+        if EncryptionManager.executor is None:
+            EncryptionManager.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kdf')
+
+        def done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Ошибка шифрования: {e}")
+                result = None
+            EncryptionManager.scheduler.schedule_once(lambda dt: callback(result))
+
+        EncryptionManager.executor.submit(func, *args).add_done_callback(done)
+
+    @staticmethod
+    def warm_up():
+        """Калибровка KDF в фоне, чтобы не ждать ее при первой записи"""
+        EncryptionManager.run_async(EncryptionManager.kdf_iterations, lambda result: None)
+
+    @staticmethod
+    def clear_key_cache():
+        """Удаление ключей и расшифрованных меток сессии из памяти"""
+        EncryptionManager.key_cache.clear()
+        EncryptionManager.read_cache.clear()